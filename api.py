@@ -1,17 +1,27 @@
 # Make sure this file is in c:\Users\hp\YUVA\api.py
 # and you run: python -m uvicorn api:app --reload from c:\Users\hp\YUVA
 
-from fastapi import FastAPI
+from fastapi import FastAPI, Header, HTTPException, Request, Response
 from pydantic import BaseModel
-from typing import List
-import requests
+from typing import List, Optional
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
 import sys
 import os
+import asyncio
+import hashlib
+import json
+import math
 
 # Ensure backend.model1 is importable regardless of how the app is started
 sys.path.append(os.path.join(os.path.dirname(__file__), "backend"))
-from model1 import predict_disease
+from model1 import submit_prediction, predict_disease_topk_batch, resolve_symptoms, suggest_symptoms, next_question, warm_up, model_info
+from model1 import MAX_BATCH_SIZE, DEFAULT_TOP_K, DEFAULT_SUGGEST_LIMIT, SUGGEST_CACHE_MAX_AGE_S
+from csv_stream import CsvStreamScorer, UploadError, body_decoder
+from hospital_service import RESULT_LIMIT, MAX_DISTANCE_KM, HospitalsUnavailable
+from hospital_service import find_hospitals, get_hospital_index, hospital_info, close_client
+from translation_service import get_translation_cache, translate_remote, translation_info, close_translation_client
+from translation_service import request_deadline, budget_report, translate_many_remote, MAX_TRANSLATION_BATCH
 
 app = FastAPI()
 
@@ -23,24 +33,178 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+@app.on_event("startup")
+def load_model_on_startup():
+    # Load and warm the shared model before serving so no request pays the unpickling cost
+    try:
+        warm_up()
+    except Exception as e:
+        print(f"Model warm-up failed: {e}")
+    # Build the offline hospital index now rather than on the first /hospitals call
+    get_hospital_index()
+
+@app.on_event("shutdown")
+async def close_upstream_clients():
+    await close_client()
+    await close_translation_client()
+
+@app.get("/model/info")
+def get_model_info():
+    return model_info()
+
+@app.get("/symptoms/suggest")
+def symptoms_suggest(request: Request, q: str = "", limit: int = DEFAULT_SUGGEST_LIMIT):
+    # Same query, same model -> same bytes, so browsers and proxies can cache and revalidate
+    body = json.dumps(suggest_symptoms(q, limit), ensure_ascii=False).encode("utf-8")
+    etag = '"%s"' % hashlib.sha1(body).hexdigest()[:16]
+    headers = {"Cache-Control": f"public, max-age={SUGGEST_CACHE_MAX_AGE_S}", "ETag": etag}
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
+
 class PredictRequest(BaseModel):
     symptoms: List[str]
+    top_k: int = DEFAULT_TOP_K
+
+class Diagnosis(BaseModel):
+    disease: str
+    probability: float
+
+class SymptomMatch(BaseModel):
+    input: str
+    symptom: str
+    method: str
+    score: float
+
+class Candidate(BaseModel):
+    disease: str
+    evidence: List[str]
 
 class PredictResponse(BaseModel):
     prediction: str
+    differential: List[Diagnosis] = []
+    matched: List[SymptomMatch] = []
+    unmatched: List[str] = []
+    candidates: List[Candidate] = []
+    candidates_exact: bool = False
+
+def _resolve_and_submit(symptoms, top_k):
+    resolution = resolve_symptoms(symptoms)
+    return resolution, submit_prediction(resolution["symptoms"], top_k)
 
 @app.post("/predict", response_model=PredictResponse)
-def predict(req: PredictRequest):
+async def predict(req: PredictRequest):
     try:
-        prediction = predict_disease(req.symptoms)
-        return PredictResponse(prediction=prediction)
+        # Symptom resolution, a first-call model load and inline scoring (batching disabled)
+        # all run in the threadpool, never on the event loop
+        resolution, future = await asyncio.to_thread(_resolve_and_submit, req.symptoms, req.top_k)
+        # Cache hits resolve at once; misses are scored together with concurrent requests
+        differential = await asyncio.wrap_future(future)
+        return PredictResponse(prediction=differential[0]["disease"], differential=differential,
+                               matched=resolution["matched"], unmatched=resolution["unmatched"],
+                               candidates=resolution["candidates"],
+                               candidates_exact=resolution["candidates_exact"])
     except Exception as e:
         # Return a clear error for debugging
         return PredictResponse(prediction=f"Error: {str(e)}")
 
+class BatchPredictRequest(BaseModel):
+    items: List[PredictRequest]
+
+class BatchPredictResponse(BaseModel):
+    results: List[PredictResponse]
+
+@app.post("/predict/batch", response_model=BatchPredictResponse)
+def predict_batch(req: BatchPredictRequest):
+    if len(req.items) > MAX_BATCH_SIZE:
+        raise HTTPException(status_code=413, detail=f"At most {MAX_BATCH_SIZE} items per batch")
+    try:
+        k = max((item.top_k for item in req.items), default=DEFAULT_TOP_K)
+        resolutions = [resolve_symptoms(item.symptoms) for item in req.items]
+        differentials = predict_disease_topk_batch([r["symptoms"] for r in resolutions], k)
+    except Exception as e:
+        return BatchPredictResponse(results=[PredictResponse(prediction=f"Error: {str(e)}")] * len(req.items))
+    return BatchPredictResponse(results=[
+        PredictResponse(prediction=d[0]["disease"], differential=d[:max(1, item.top_k)],
+                        matched=r["matched"], unmatched=r["unmatched"],
+                        candidates=r["candidates"], candidates_exact=r["candidates_exact"])
+        for item, r, d in zip(req.items, resolutions, differentials)
+    ])
+
+class NextQuestionRequest(BaseModel):
+    symptoms: List[str]
+    absent: List[str] = []
+    top_k: int = DEFAULT_TOP_K
+
+class TriageQuestion(BaseModel):
+    symptom: str
+    label: str
+    information_gain: float
+    p_yes: float
+
+class NextQuestionResponse(BaseModel):
+    question: Optional[TriageQuestion] = None
+    alternatives: List[TriageQuestion] = []
+    done: bool
+    entropy: float
+    exact_match: bool
+    differential: List[Diagnosis] = []
+    matched: List[SymptomMatch] = []
+    unmatched: List[str] = []
+
+@app.post("/predict/next-question", response_model=NextQuestionResponse)
+def predict_next_question(req: NextQuestionRequest):
+    try:
+        return next_question(req.symptoms, req.absent, req.top_k)
+    except RuntimeError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+
+class UploadStreamingResponse(StreamingResponse):
+    """Streams a response whose body iterator is still reading the request.
+
+    The stock StreamingResponse watches receive() for client disconnects, which would
+    swallow the upload's body chunks; here only request.stream() reads them, and a
+    disconnect ends it with ClientDisconnect.
+    """
+
+    async def __call__(self, scope, receive, send):
+        await self.stream_response(send)
+        if self.background is not None:
+            await self.background()
+
+@app.post("/predict/upload")
+async def predict_upload(request: Request, top_k: int = DEFAULT_TOP_K):
+    # Body may be a raw CSV or a multipart/form-data file upload; either way it is parsed
+    # as it arrives and scored in fixed-size row chunks off the event loop
+    try:
+        decode, decode_end = body_decoder(request.headers.get("content-type", ""))
+    except UploadError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    scorer = CsvStreamScorer(top_k)
+
+    def step(chunk):
+        return scorer.feed(decode(chunk))
+
+    def finish():
+        return scorer.feed(decode_end()) + scorer.finish()
+
+    async def ndjson():
+        try:
+            async for chunk in request.stream():
+                out = await asyncio.to_thread(step, chunk)
+                if out:
+                    yield out
+            yield await asyncio.to_thread(finish)
+        except UploadError as e:
+            yield (json.dumps({"error": str(e)}) + "\n").encode("utf-8")
+
+    return UploadStreamingResponse(ndjson(), media_type="application/x-ndjson")
+
 class LocationRequest(BaseModel):
     latitude: float
     longitude: float
+    limit: int = RESULT_LIMIT
+    radius_km: float = MAX_DISTANCE_KM
 
 class Hospital(BaseModel):
     name: str
@@ -50,136 +214,50 @@ class Hospital(BaseModel):
     distance_km: float
 
 @app.post("/hospitals", response_model=List[Hospital])
-def get_nearby_hospitals(location: LocationRequest):
-    delta = 0.4
-    url = "https://nominatim.openstreetmap.org/search"
-    params = {
-        "q": "hospital",
-        "format": "json",
-        "limit": 30,
-        "extratags": 1,
-        "addressdetails": 1,
-        "bounded": 1,
-        "viewbox": f"{location.longitude-delta},{location.latitude+delta},{location.longitude+delta},{location.latitude-delta}"
-    }
-    response = requests.get(url, params=params, headers={"User-Agent": "hospital-finder-app"})
-    hospitals_data = response.json()
-    print("Nominatim API response:", hospitals_data)  # <-- Add this line
-
-    from math import radians, cos, sin, asin, sqrt
-
-    def haversine(lat1, lon1, lat2, lon2):
-        R = 6371
-        dlat = radians(lat2 - lat1)
-        dlon = radians(lon2 - lon1)
-        a = sin(dlat/2)**2 + cos(radians(lat1)) * cos(radians(lat2)) * sin(dlon/2)**2
-        c = 2 * asin(sqrt(a))
-        return R * c
-
-    result = []
-    for h in hospitals_data:
-        try:
-            lat = float(h["lat"])
-            lon = float(h["lon"])
-            dist = haversine(location.latitude, location.longitude, lat, lon)
-            if dist <= 20:
-                result.append(Hospital(
-                    name=h.get("display_name", "Unknown Hospital").split(",")[0],
-                    address=h.get("display_name", ""),
-                    latitude=lat,
-                    longitude=lon,
-                    distance_km=round(dist, 2)
-                ))
-        except Exception:
-            continue
-    
-    # If result is empty after OpenStreetMap API, add some hardcoded hospitals for testing
-    if len(result) == 0:
-        # Add hardcoded hospitals near VIT Chennai
-        hardcoded_hospitals = [
-            {
-                "name": "VIT University Health Centre",
-                "address": "VIT Chennai, Vandalur-Kelambakkam Road, Chennai",
-                "latitude": 12.8400,
-                "longitude": 80.1557,
-                "distance_km": 0.2
-            },
-            {
-                "name": "Apollo Hospital",
-                "address": "Perumbakkam, Chennai",
-                "latitude": 12.9126,
-                "longitude": 80.2270,
-                "distance_km": 8.3
-            },
-            {
-                "name": "Chettinad Hospital",
-                "address": "Kelambakkam, Chennai",
-                "latitude": 12.7852,
-                "longitude": 80.2296,
-                "distance_km": 7.5
-            }
-        ]
-        
-        for h in hardcoded_hospitals:
-            result.append(Hospital(**h))
-    
-    return result
+async def get_nearby_hospitals(location: LocationRequest):
+    # Runs on the event loop with its own pooled client, so a slow upstream holds no worker thread
+    try:
+        hospitals = await find_hospitals(location.latitude, location.longitude, location.limit, location.radius_km)
+    except HospitalsUnavailable as e:
+        raise HTTPException(status_code=503, detail="Hospital lookup temporarily unavailable",
+                            headers={"Retry-After": str(math.ceil(e.retry_after_s))})
+    return [Hospital(**h) for h in hospitals]
+
+@app.get("/hospitals/info")
+def get_hospital_info():
+    return hospital_info()
 
 class TranslateRequest(BaseModel):
     text: str
     src_lang: str
     tgt_lang: str
+    # Time budget in ms for the whole fallback chain; the X-Deadline-Ms header works too
+    deadline_ms: Optional[float] = None
 
 class TranslateResponse(BaseModel):
     translation: str
+    # passthrough, phrasebook, cache, libretranslate, google or none
+    tier: Optional[str] = None
+    provider: Optional[str] = None
+    budget_ms: Optional[float] = None
+    elapsed_ms: Optional[float] = None
 
-def translate_with_libretranslate(text: str, src_lang: str, tgt_lang: str) -> str:
-    """Translate using LibreTranslate API"""
-    url = "https://libretranslate.de/translate"
-    payload = {
-        "q": text,
-        "source": src_lang,
-        "target": tgt_lang,
-        "format": "text"
-    }
-    
-    headers = {
-        "Content-Type": "application/json",
-        "User-Agent": "YUVA-Medical-Platform/1.0"
-    }
-    
-    try:
-        resp = requests.post(url, json=payload, headers=headers, timeout=10)
-        resp.raise_for_status()
-        data = resp.json()
-        return data.get("translatedText", "")
-    except Exception as e:
-        print(f"LibreTranslate error: {e}")
-        return ""
+class TranslateBatchRequest(BaseModel):
+    texts: List[str]
+    src_lang: str
+    tgt_lang: str
+    deadline_ms: Optional[float] = None
 
-def translate_with_google(text: str, src_lang: str, tgt_lang: str) -> str:
-    """Fallback translation using Google Translate (simple approach)"""
-    try:
-        # Simple Google Translate URL approach
-        url = "https://translate.googleapis.com/translate_a/single"
-        params = {
-            "client": "gtx",
-            "sl": src_lang,
-            "tl": tgt_lang,
-            "dt": "t",
-            "q": text
-        }
-        
-        resp = requests.get(url, params=params, timeout=10)
-        resp.raise_for_status()
-        data = resp.json()
-        
-        if data and len(data) > 0 and len(data[0]) > 0:
-            return data[0][0][0]
-        return ""
-    except Exception as e:
-        print(f"Google Translate error: {e}")
-        return ""
+class BatchTranslation(BaseModel):
+    translation: str
+    tier: str
+    provider: Optional[str] = None
+
+class TranslateBatchResponse(BaseModel):
+    # One per text, in request order; translation is "" where tier is none
+    results: List[BatchTranslation]
+    budget_ms: Optional[float] = None
+    elapsed_ms: Optional[float] = None
 
 def translate_with_local(text: str, src_lang: str, tgt_lang: str) -> str:
     """Local fallback translation for common medical terms"""
@@ -233,36 +311,84 @@ def translate_with_local(text: str, src_lang: str, tgt_lang: str) -> str:
         print(f"Local translation error: {e}")
         return ""
 
+@app.get("/translate/info")
+def get_translation_info():
+    return translation_info()
+
 @app.post("/translate", response_model=TranslateResponse)
-def translate(req: TranslateRequest):
+async def translate(req: TranslateRequest, x_deadline_ms: Optional[str] = Header(None)):
     print(f"Translating: '{req.text}' from {req.src_lang} to {req.tgt_lang}")
+    deadline = request_deadline(req.deadline_ms if req.deadline_ms is not None else x_deadline_ms)
     
     # If source and target languages are the same, return original text
     if req.src_lang == req.tgt_lang:
-        return TranslateResponse(translation=req.text)
+        return TranslateResponse(translation=req.text, tier="passthrough", **budget_report(deadline))
     
     # Try local medical translations first (fastest)
     translation = translate_with_local(req.text, req.src_lang, req.tgt_lang)
     if translation:
         print(f"Local translation found: '{translation}'")
-        return TranslateResponse(translation=translation)
+        return TranslateResponse(translation=translation, tier="phrasebook", **budget_report(deadline))
     
-    # Try LibreTranslate
-    print("Trying LibreTranslate...")
-    translation = translate_with_libretranslate(req.text, req.src_lang, req.tgt_lang)
-    if translation:
-        print(f"LibreTranslate successful: '{translation}'")
-        return TranslateResponse(translation=translation)
+    # Then anything a provider has translated before
+    cache = get_translation_cache()
+    # SQLite I/O goes to the threadpool so it does not stall other requests on the event loop
+    cached = await asyncio.to_thread(cache.get, req.text, req.src_lang, req.tgt_lang)
+    if cached:
+        print(f"Cached translation found ({cached[1]}): '{cached[0]}'")
+        return TranslateResponse(translation=cached[0], tier="cache", provider=cached[1], **budget_report(deadline))
     
-    # Try Google Translate as fallback
-    print("LibreTranslate failed, trying Google Translate...")
-    translation = translate_with_google(req.text, req.src_lang, req.tgt_lang)
+    # LibreTranslate, hedged with Google Translate if it is slow or failing, within what is left of the budget
+    translation, provider = await translate_remote(req.text, req.src_lang, req.tgt_lang, deadline)
     if translation:
-        print(f"Google Translate successful: '{translation}'")
-        return TranslateResponse(translation=translation)
+        print(f"{provider} successful: '{translation}'")
+        await asyncio.to_thread(cache.put, req.text, req.src_lang, req.tgt_lang, translation, provider)
+        return TranslateResponse(translation=translation, tier=provider, provider=provider, **budget_report(deadline))
     
     # If all fail, return helpful error message
-    return TranslateResponse(translation="Translation service temporarily unavailable. Please try common medical phrases like 'I have a headache' or 'Where does it hurt?'")
+    return TranslateResponse(translation="Translation service temporarily unavailable. Please try common medical phrases like 'I have a headache' or 'Where does it hurt?'",
+                             tier="none", **budget_report(deadline))
+
+@app.post("/translate/batch", response_model=TranslateBatchResponse)
+async def translate_batch(req: TranslateBatchRequest, x_deadline_ms: Optional[str] = Header(None)):
+    if len(req.texts) > MAX_TRANSLATION_BATCH:
+        raise HTTPException(status_code=413, detail=f"At most {MAX_TRANSLATION_BATCH} texts per batch")
+    deadline = request_deadline(req.deadline_ms if req.deadline_ms is not None else x_deadline_ms)
+    if req.src_lang == req.tgt_lang:
+        return TranslateBatchResponse(results=[BatchTranslation(translation=text, tier="passthrough") for text in req.texts],
+                                      **budget_report(deadline))
+    
+    # Phrasebook and cache hits are answered here; only the rest go upstream
+    results = [None] * len(req.texts)
+    lookups = []
+    for i, text in enumerate(req.texts):
+        translation = translate_with_local(text, req.src_lang, req.tgt_lang)
+        if translation:
+            results[i] = BatchTranslation(translation=translation, tier="phrasebook")
+        else:
+            lookups.append(i)
+    cache = get_translation_cache()
+    # One SQLite transaction for the whole batch, in the threadpool rather than on the event loop
+    cached = await asyncio.to_thread(cache.get_many, [req.texts[i] for i in lookups], req.src_lang, req.tgt_lang)
+    misses = []
+    for i, hit in zip(lookups, cached):
+        if hit:
+            results[i] = BatchTranslation(translation=hit[0], tier="cache", provider=hit[1])
+        else:
+            misses.append(i)
+    
+    if misses:
+        print(f"Translating {len(misses)} of {len(req.texts)} texts from {req.src_lang} to {req.tgt_lang} upstream")
+        remote = await translate_many_remote([req.texts[i] for i in misses], req.src_lang, req.tgt_lang, deadline)
+        stores = []
+        for i, (translation, provider) in zip(misses, remote):
+            if translation:
+                stores.append((req.texts[i], translation, provider))
+                results[i] = BatchTranslation(translation=translation, tier=provider, provider=provider)
+            else:
+                results[i] = BatchTranslation(translation="", tier="none")
+        await asyncio.to_thread(cache.put_many, stores, req.src_lang, req.tgt_lang)
+    return TranslateBatchResponse(results=results, **budget_report(deadline))
 
 if __name__ == "__main__":
     import uvicorn
@@ -5,6 +5,7 @@ A lightweight version that focuses on core functionality
 """
 
 import json
+import hashlib
 import sys
 import os
 from http.server import HTTPServer, BaseHTTPRequestHandler
@@ -16,28 +17,60 @@ sys.path.append(os.path.join(os.path.dirname(__file__), "backend"))
 
 # Import the model function
 try:
-    from model1 import predict_disease
+    from model1 import predict_disease_topk, predict_disease_topk_batch, resolve_symptoms, suggest_symptoms, next_question, warm_up, model_info
+    from model1 import MAX_BATCH_SIZE, DEFAULT_TOP_K, DEFAULT_SUGGEST_LIMIT, SUGGEST_CACHE_MAX_AGE_S
+    from csv_stream import CsvStreamScorer, UploadError, body_decoder, UPLOAD_READ_BYTES
     MODEL_AVAILABLE = True
 except ImportError as e:
     print(f"Warning: Model not available: {e}")
     MODEL_AVAILABLE = False
 
+try:
+    from translation_service import get_translation_cache, translation_info, LIBRETRANSLATE_URL
+    from translation_service import TRANSLATION_TIMEOUT_S, DEADLINE_HEADER, request_deadline, budget_report
+    TRANSLATION_SERVICE_AVAILABLE = True
+except ImportError as e:
+    print(f"Warning: Translation cache and deadlines not available: {e}")
+    TRANSLATION_SERVICE_AVAILABLE = False
+
 class YUVAHandler(BaseHTTPRequestHandler):
     def do_OPTIONS(self):
         """Handle CORS preflight requests"""
         self.send_response(200)
         self.send_header('Access-Control-Allow-Origin', '*')
         self.send_header('Access-Control-Allow-Methods', 'GET, POST, OPTIONS')
-        self.send_header('Access-Control-Allow-Headers', 'Content-Type')
+        self.send_header('Access-Control-Allow-Headers', 'Content-Type, If-None-Match, X-Deadline-Ms')
         self.end_headers()
 
+    def do_GET(self):
+        """Handle GET requests"""
+        url = urllib.parse.urlparse(self.path)
+        if url.path == '/model/info':
+            if MODEL_AVAILABLE:
+                self.send_json_response(model_info())
+            else:
+                self.send_json_response({"loaded": False}, status=503)
+        elif url.path == '/symptoms/suggest':
+            self.handle_symptom_suggest(urllib.parse.parse_qs(url.query))
+        elif url.path == '/translate/info' and TRANSLATION_SERVICE_AVAILABLE:
+            self.send_json_response(translation_info())
+        else:
+            self.send_error(404, "Not Found")
+
     def do_POST(self):
         """Handle POST requests"""
-        if self.path == '/predict':
+        url = urllib.parse.urlparse(self.path)
+        if url.path == '/predict':
             self.handle_predict()
-        elif self.path == '/translate':
+        elif url.path == '/predict/batch':
+            self.handle_predict_batch()
+        elif url.path == '/predict/next-question':
+            self.handle_next_question()
+        elif url.path == '/predict/upload':
+            self.handle_predict_upload(urllib.parse.parse_qs(url.query))
+        elif url.path == '/translate':
             self.handle_translate()
-        elif self.path == '/hospitals':
+        elif url.path == '/hospitals':
             self.handle_hospitals()
         else:
             self.send_error(404, "Not Found")
@@ -52,17 +85,133 @@ class YUVAHandler(BaseHTTPRequestHandler):
             symptoms = data.get('symptoms', [])
             
             if not MODEL_AVAILABLE:
-                prediction = "Model not available - please check backend setup"
+                response = {"prediction": "Model not available - please check backend setup"}
             else:
-                prediction = predict_disease(symptoms)
+                resolution = resolve_symptoms(symptoms)
+                differential = predict_disease_topk(resolution["symptoms"], data.get('top_k', DEFAULT_TOP_K))
+                response = {"prediction": differential[0]["disease"], "differential": differential,
+                            "matched": resolution["matched"], "unmatched": resolution["unmatched"],
+                            "candidates": resolution["candidates"],
+                            "candidates_exact": resolution["candidates_exact"]}
             
-            response = {"prediction": prediction}
             self.send_json_response(response)
             
         except Exception as e:
             error_response = {"prediction": f"Error: {str(e)}"}
             self.send_json_response(error_response, status=500)
 
+    def handle_predict_batch(self):
+        """Handle batch disease prediction requests"""
+        try:
+            content_length = int(self.headers['Content-Length'])
+            post_data = self.rfile.read(content_length)
+            data = json.loads(post_data.decode('utf-8'))
+
+            items = data.get('items', [])
+            symptom_lists = [item.get('symptoms', []) for item in items]
+            top_ks = [item.get('top_k', DEFAULT_TOP_K) for item in items]
+
+            if not MODEL_AVAILABLE:
+                results = [{"prediction": "Model not available - please check backend setup"}] * len(items)
+            elif len(items) > MAX_BATCH_SIZE:
+                self.send_json_response({"error": f"At most {MAX_BATCH_SIZE} items per batch"}, status=413)
+                return
+            else:
+                resolutions = [resolve_symptoms(symptoms) for symptoms in symptom_lists]
+                differentials = predict_disease_topk_batch([r["symptoms"] for r in resolutions],
+                                                           max(top_ks, default=DEFAULT_TOP_K))
+                results = [
+                    {"prediction": d[0]["disease"], "differential": d[:max(1, k)],
+                     "matched": r["matched"], "unmatched": r["unmatched"],
+                     "candidates": r["candidates"], "candidates_exact": r["candidates_exact"]}
+                    for r, d, k in zip(resolutions, differentials, top_ks)
+                ]
+
+            response = {"results": results}
+            self.send_json_response(response)
+
+        except Exception as e:
+            error_response = {"error": f"Error: {str(e)}"}
+            self.send_json_response(error_response, status=500)
+
+    def handle_next_question(self):
+        """Handle interactive triage requests: which symptom to ask about next"""
+        if not MODEL_AVAILABLE:
+            self.send_json_response({"error": "Model not available"}, status=503)
+            return
+        try:
+            content_length = int(self.headers['Content-Length'])
+            data = json.loads(self.rfile.read(content_length).decode('utf-8'))
+            response = next_question(data.get('symptoms', []), data.get('absent', []),
+                                     data.get('top_k', DEFAULT_TOP_K))
+            self.send_json_response(response)
+        except RuntimeError as e:
+            self.send_json_response({"error": str(e)}, status=503)
+        except Exception as e:
+            self.send_json_response({"error": f"Error: {str(e)}"}, status=500)
+
+    def handle_predict_upload(self, params):
+        """Handle CSV uploads (raw or multipart): rows are scored in chunks and streamed back as NDJSON"""
+        if not MODEL_AVAILABLE:
+            self.send_json_response({"error": "Model not available"}, status=503)
+            return
+        if self.headers.get('Content-Length') is None:
+            self.send_json_response({"error": "Content-Length required"}, status=411)
+            return
+        try:
+            top_k = int(params.get('top_k', [DEFAULT_TOP_K])[0])
+            decode, decode_end = body_decoder(self.headers.get('Content-Type', ''))
+            scorer = CsvStreamScorer(top_k)
+        except (ValueError, UploadError) as e:
+            self.send_json_response({"error": str(e)}, status=400)
+            return
+
+        # HTTP/1.0 response without Content-Length: results are written as soon as each
+        # chunk of rows is scored and the connection is closed at the end
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/x-ndjson')
+        self.send_header('Access-Control-Allow-Origin', '*')
+        self.end_headers()
+        remaining = int(self.headers['Content-Length'])
+        try:
+            while remaining > 0:
+                chunk = self.rfile.read(min(UPLOAD_READ_BYTES, remaining))
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+                out = scorer.feed(decode(chunk))
+                if out:
+                    self.wfile.write(out)
+            self.wfile.write(scorer.feed(decode_end()) + scorer.finish())
+        except UploadError as e:
+            self.wfile.write((json.dumps({"error": str(e)}) + "\n").encode('utf-8'))
+
+    def handle_symptom_suggest(self, params):
+        """Handle symptom typeahead requests; responses are cacheable and revalidated by ETag"""
+        if not MODEL_AVAILABLE:
+            self.send_json_response({"error": "Model not available"}, status=503)
+            return
+        try:
+            query = params.get('q', [''])[0]
+            limit = int(params.get('limit', [DEFAULT_SUGGEST_LIMIT])[0])
+            body = json.dumps(suggest_symptoms(query, limit), ensure_ascii=False).encode('utf-8')
+        except ValueError:
+            self.send_json_response({"error": "limit must be an integer"}, status=400)
+            return
+
+        etag = '"%s"' % hashlib.sha1(body).hexdigest()[:16]
+        status = 304 if self.headers.get('If-None-Match') == etag else 200
+        self.send_response(status)
+        self.send_header('Cache-Control', f'public, max-age={SUGGEST_CACHE_MAX_AGE_S}')
+        self.send_header('ETag', etag)
+        self.send_header('Access-Control-Allow-Origin', '*')
+        if status == 200:
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        if status == 200:
+            self.wfile.write(body)
+
     def handle_translate(self):
         """Handle translation requests"""
         try:
@@ -73,6 +222,9 @@ class YUVAHandler(BaseHTTPRequestHandler):
             text = data.get('text', '')
             src_lang = data.get('src_lang', 'en')
             tgt_lang = data.get('tgt_lang', 'es')
+            deadline = None
+            if TRANSLATION_SERVICE_AVAILABLE:
+                deadline = request_deadline(data.get('deadline_ms', self.headers.get(DEADLINE_HEADER)))
             
             # Local medical translations
             medical_translations = {
@@ -123,29 +275,48 @@ class YUVAHandler(BaseHTTPRequestHandler):
             # Try local translation first
             text_lower = text.lower().strip()
             translation = ""
+            tier = "none"
+            provider = None
             
             if src_lang in medical_translations and tgt_lang in medical_translations[src_lang]:
                 translation = medical_translations[src_lang][tgt_lang].get(text_lower, "")
+                tier = "phrasebook" if translation else tier
+            
+            # Then anything a provider has translated before, in this or the FastAPI server
+            if not translation and TRANSLATION_SERVICE_AVAILABLE:
+                cache = get_translation_cache()
+                cached = cache.get(text, src_lang, tgt_lang)
+                if cached:
+                    translation, provider = cached
+                    tier = "cache"
             
-            # If no local translation, try LibreTranslate
+            # If no local translation, try LibreTranslate with whatever is left of the budget
             if not translation:
-                translation = self.translate_with_libretranslate(text, src_lang, tgt_lang)
+                timeout = min(TRANSLATION_TIMEOUT_S, deadline.remaining()) if deadline else 10
+                if timeout > 0:
+                    translation = self.translate_with_libretranslate(text, src_lang, tgt_lang, timeout)
+                if translation:
+                    tier = provider = "libretranslate"
+                    if TRANSLATION_SERVICE_AVAILABLE:
+                        cache.put(text, src_lang, tgt_lang, translation, "libretranslate")
             
             # If still no translation, return helpful message
             if not translation:
                 translation = f"Translation not available for '{text}'. Try common medical phrases like 'I have a headache' or 'Where does it hurt?'"
             
-            response = {"translation": translation}
+            response = {"translation": translation, "tier": tier, "provider": provider}
+            if deadline:
+                response.update(budget_report(deadline))
             self.send_json_response(response)
             
         except Exception as e:
             error_response = {"translation": f"Translation error: {str(e)}"}
             self.send_json_response(error_response, status=500)
 
-    def translate_with_libretranslate(self, text, src_lang, tgt_lang):
+    def translate_with_libretranslate(self, text, src_lang, tgt_lang, timeout=10):
         """Try LibreTranslate API"""
         try:
-            url = "https://libretranslate.de/translate"
+            url = LIBRETRANSLATE_URL if TRANSLATION_SERVICE_AVAILABLE else "https://libretranslate.de/translate"
             data = {
                 "q": text,
                 "source": src_lang,
@@ -157,7 +328,7 @@ class YUVAHandler(BaseHTTPRequestHandler):
             req.add_header('Content-Type', 'application/json')
             req.add_header('User-Agent', 'YUVA-Medical-Platform/1.0')
             
-            with urllib.request.urlopen(req, timeout=10) as response:
+            with urllib.request.urlopen(req, timeout=timeout) as response:
                 result = json.loads(response.read().decode('utf-8'))
                 return result.get('translatedText', '')
         except Exception as e:
@@ -214,12 +385,25 @@ class YUVAHandler(BaseHTTPRequestHandler):
 
 def run_server(port=5000):
     """Run the HTTP server"""
+    if MODEL_AVAILABLE:
+        # Load the model once up front instead of on the first /predict call
+        try:
+            warm_up()
+        except Exception as e:
+            print(f"Model warm-up failed: {e}")
+
     server_address = ('', port)
     httpd = HTTPServer(server_address, YUVAHandler)
     print(f"YUVA Medical Platform API running on port {port}")
     print(f"Available endpoints:")
     print(f"  POST /predict - Disease prediction")
+    print(f"  POST /predict/batch - Batch disease prediction")
+    print(f"  POST /predict/next-question - Next symptom to ask about")
+    print(f"  POST /predict/upload - Stream a symptom CSV, get NDJSON predictions")
+    print(f"  GET  /model/info - Model load time and size")
+    print(f"  GET  /symptoms/suggest?q= - Symptom autocomplete")
     print(f"  POST /translate - Medical translation")
+    print(f"  GET  /translate/info - Translation cache hit rate")
     print(f"  POST /hospitals - Hospital locations")
     print(f"  Access at: http://localhost:{port}")
     
@@ -1,20 +1,22 @@
 # Make sure this file is in c:\Users\hp\YUVA\api.py
 # and you run: python -m uvicorn api:app --reload from c:\Users\hp\YUVA
 
-from fastapi import FastAPI
+from fastapi import FastAPI, HTTPException
 from pydantic import BaseModel
 from typing import List
 import requests
 from fastapi.middleware.cors import CORSMiddleware
 import sys
 import os
+import math
 
 # Hugging Face translation imports
 from transformers import MarianMTModel, MarianTokenizer
 
 # Ensure backend.model1 is importable regardless of how the app is started
 sys.path.append(os.path.join(os.path.dirname(__file__), "backend"))
-from model1 import predict_disease
+from model1 import predict_disease, warm_up, model_info
+from hospital_service import HospitalsUnavailable, find_hospitals, get_hospital_index, close_client
 
 app = FastAPI()
 
@@ -26,6 +28,24 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+@app.on_event("startup")
+def load_model_on_startup():
+    # Load and warm the shared model before serving so no request pays the unpickling cost
+    try:
+        warm_up()
+    except Exception as e:
+        print(f"Model warm-up failed: {e}")
+    # Build the offline hospital index now rather than on the first /hospitals call
+    get_hospital_index()
+
+@app.on_event("shutdown")
+async def close_upstream_clients():
+    await close_client()
+
+@app.get("/model/info")
+def get_model_info():
+    return model_info()
+
 class PredictRequest(BaseModel):
     symptoms: List[str]
 
@@ -53,80 +73,14 @@ class Hospital(BaseModel):
     distance_km: float
 
 @app.post("/hospitals", response_model=List[Hospital])
-def get_nearby_hospitals(location: LocationRequest):
-    delta = 0.4
-    url = "https://nominatim.openstreetmap.org/search"
-    params = {
-        "q": "hospital",
-        "format": "json",
-        "limit": 30,
-        "extratags": 1,
-        "addressdetails": 1,
-        "bounded": 1,
-        "viewbox": f"{location.longitude-delta},{location.latitude+delta},{location.longitude+delta},{location.latitude-delta}"
-    }
-    response = requests.get(url, params=params, headers={"User-Agent": "hospital-finder-app"})
-    hospitals_data = response.json()
-    print("Nominatim API response:", hospitals_data)  # <-- Add this line
-
-    from math import radians, cos, sin, asin, sqrt
-
-    def haversine(lat1, lon1, lat2, lon2):
-        R = 6371
-        dlat = radians(lat2 - lat1)
-        dlon = radians(lon2 - lon1)
-        a = sin(dlat/2)**2 + cos(radians(lat1)) * cos(radians(lat2)) * sin(dlon/2)**2
-        c = 2 * asin(sqrt(a))
-        return R * c
-
-    result = []
-    for h in hospitals_data:
-        try:
-            lat = float(h["lat"])
-            lon = float(h["lon"])
-            dist = haversine(location.latitude, location.longitude, lat, lon)
-            if dist <= 20:
-                result.append(Hospital(
-                    name=h.get("display_name", "Unknown Hospital").split(",")[0],
-                    address=h.get("display_name", ""),
-                    latitude=lat,
-                    longitude=lon,
-                    distance_km=round(dist, 2)
-                ))
-        except Exception:
-            continue
-    
-    # If result is empty after OpenStreetMap API, add some hardcoded hospitals for testing
-    if len(result) == 0:
-        # Add hardcoded hospitals near VIT Chennai
-        hardcoded_hospitals = [
-            {
-                "name": "VIT University Health Centre",
-                "address": "VIT Chennai, Vandalur-Kelambakkam Road, Chennai",
-                "latitude": 12.8400,
-                "longitude": 80.1557,
-                "distance_km": 0.2
-            },
-            {
-                "name": "Apollo Hospital",
-                "address": "Perumbakkam, Chennai",
-                "latitude": 12.9126,
-                "longitude": 80.2270,
-                "distance_km": 8.3
-            },
-            {
-                "name": "Chettinad Hospital",
-                "address": "Kelambakkam, Chennai",
-                "latitude": 12.7852,
-                "longitude": 80.2296,
-                "distance_km": 7.5
-            }
-        ]
-        
-        for h in hardcoded_hospitals:
-            result.append(Hospital(**h))
-    
-    return result
+async def get_nearby_hospitals(location: LocationRequest):
+    # Runs on the event loop with its own pooled client, so a slow upstream holds no worker thread
+    try:
+        hospitals = await find_hospitals(location.latitude, location.longitude)
+    except HospitalsUnavailable as e:
+        raise HTTPException(status_code=503, detail="Hospital lookup temporarily unavailable",
+                            headers={"Retry-After": str(math.ceil(e.retry_after_s))})
+    return [Hospital(**h) for h in hospitals]
 
 class TranslateRequest(BaseModel):
     text: str
@@ -0,0 +1,91 @@
+"""
+Inverted symptom -> disease index.
+
+For every symptom column, the set of diseases it occurs with anywhere in the
+training data, stored as a bitset (bit i = classes[i]). Intersecting the sets of
+the confirmed symptoms gives the diseases compatible with all of them, which is
+returned as evidence next to a prediction.
+
+Compatibility alone is a weak test: each symptom may co-occur with a disease in a
+different training row. When the distinct training rows are available, row_support()
+looks for rows that contain every symptom at once, which is what the optional
+model-skipping shortcut relies on.
+"""
+
+import numpy as np
+
+
+class CandidateIndex:
+    """Bitset per symptom of the diseases it co-occurs with in training."""
+
+    def __init__(self, disease_bits, classes, symptom_cols, rows=None, labels=None, counts=None):
+        self.classes = [str(c) for c in classes]
+        self.symptom_cols = list(symptom_cols)
+        n_classes = len(self.classes)
+        # Packed little-endian bits -> (n_symptoms, n_classes) bool and one Python int per symptom
+        self.occurs = np.unpackbits(disease_bits, axis=1, count=n_classes, bitorder="little").astype(bool)
+        self._sets = [int.from_bytes(row.tobytes(), "little") for row in disease_bits]
+        self._all = (1 << n_classes) - 1
+        # Distinct training rows, for row_support(); None for stats files without them
+        self.rows = np.asarray(rows, dtype=bool) if rows is not None else None
+        self.labels = np.asarray(labels) if rows is not None else None
+        self.counts = np.asarray(counts, dtype=np.int64) if rows is not None else None
+
+    @staticmethod
+    def pack(rows, labels, n_classes):
+        """Builds the packed (n_symptoms, ceil(n_classes / 8)) uint8 bitsets from training rows and labels."""
+        occurs = np.zeros((n_classes, rows.shape[1]), dtype=bool)
+        np.logical_or.at(occurs, labels, np.asarray(rows, dtype=bool))
+        return np.packbits(occurs.T, axis=1, bitorder="little")
+
+    @classmethod
+    def from_stats(cls, stats, symptom_cols):
+        """Builds the index from a loaded symptom_stats.npz, or returns None for files written before it."""
+        if "disease_bits" not in stats:
+            return None
+        if "rows" not in stats:
+            return cls(stats["disease_bits"], stats["classes"], symptom_cols)
+        return cls(stats["disease_bits"], stats["classes"], symptom_cols,
+                   stats["rows"], stats["labels"], stats["counts"])
+
+    def compatible(self, columns):
+        """Bitmask of the diseases every one of the given symptom columns occurs with."""
+        mask = self._all
+        for j in columns:
+            mask &= self._sets[j]
+        return mask
+
+    def row_support(self, columns):
+        """Diseases of the training rows that contain every given symptom, as [(disease, share)]
+        weighted by row count, most frequent first. Empty when no row contains them all, for no
+        symptoms, or when the index was built without training rows."""
+        if not columns or self.rows is None:
+            return []
+        match = self.rows[:, sorted(columns)].all(axis=1)
+        if not match.any():
+            return []
+        weights = np.bincount(self.labels[match], weights=self.counts[match], minlength=len(self.classes))
+        total = weights.sum()
+        order = np.argsort(-weights, kind="stable")
+        return [(self.classes[d], float(weights[d] / total)) for d in order if weights[d] > 0]
+
+    def explain(self, columns):
+        """Candidate diseases with the symptoms that support each.
+
+        Returns (candidates, exact): candidates is [{"disease", "evidence"}] for the diseases
+        compatible with every symptom, or, when no disease is, those compatible with the
+        most of them (exact False). Empty for no symptoms.
+        """
+        columns = sorted(columns)
+        if not columns:
+            return [], False
+        coverage = self.occurs[columns].sum(axis=0)
+        best = int(coverage.max())
+        if best == 0:
+            return [], False
+        candidates = [
+            {"disease": self.classes[d],
+             "evidence": [self.symptom_cols[j] for j in columns if self.occurs[j, d]]}
+            for d in np.flatnonzero(coverage == best)
+        ]
+        return candidates, best == len(columns)
@@ -0,0 +1,206 @@
+"""
+Streaming bulk scoring of uploaded symptom CSVs.
+
+An upload is fed in whatever byte chunks the server receives. Complete lines are
+parsed as they arrive, one record per line (quoted fields may not contain newlines),
+scored UPLOAD_CHUNK_ROWS rows at a time and turned into NDJSON, so memory stays
+bounded by one chunk of rows however large the file is, and the first results go
+out while the rest is still uploading.
+"""
+
+import csv
+import json
+
+import numpy as np
+
+import model1
+
+UPLOAD_CHUNK_ROWS = 1000
+# Body bytes read per step by servers that pull the upload themselves
+UPLOAD_READ_BYTES = 1 << 16
+# A single CSV line longer than this is treated as a malformed upload
+MAX_LINE_BYTES = 1 << 20
+
+
+class UploadError(ValueError):
+    """The upload is not a symptom CSV that can be scored."""
+
+
+class CsvStreamScorer:
+    """Parses a symptom CSV incrementally and scores it chunk by chunk.
+
+    feed() and finish() return NDJSON bytes, one line per data row in input order:
+    {"row", "prediction", "differential"} plus "label" when the CSV has a prognosis
+    column, or {"row", "error"} for a row that cannot be read.
+    """
+
+    def __init__(self, k=model1.DEFAULT_TOP_K, chunk_rows=UPLOAD_CHUNK_ROWS):
+        # Pin one model for the whole upload, even if a new version is swapped in meanwhile
+        self.model = model1.get_model()
+        self.k = k
+        self.chunk_rows = chunk_rows
+        self.rows_seen = 0
+        self.errors = 0
+        self._partial = b""
+        self._header = None
+        self._lines = []
+
+    def _parse_header(self, line):
+        names = [name.strip() for name in next(csv.reader([line]))]
+        index = {col: j for j, col in enumerate(self.model.symptom_cols)}
+        self._source = [i for i, name in enumerate(names) if name in index]
+        self._target = [index[names[i]] for i in self._source]
+        self._label = names.index(model1.TARGET) if model1.TARGET in names else None
+        self._n_fields = len(names)
+        # Trailing empty fields (e.g. the unnamed last column of Training.csv) are optional
+        self._min_fields = max(self._source, default=-1) + 1
+        if not self._source:
+            raise UploadError("CSV header has none of the model's symptom columns")
+        self._header = names
+
+    def _score_lines(self):
+        """Scores the buffered lines and returns their NDJSON output."""
+        lines, self._lines = self._lines, []
+        X = np.zeros((len(lines), len(self.model.symptom_cols)), dtype=np.uint8)
+        labels = [None] * len(lines)
+        errors = {}
+        for r, line in enumerate(lines):
+            if line is None:
+                errors[r] = "row is not valid UTF-8"
+                continue
+            # One record per line, so r always indexes X; quoted fields cannot span lines
+            try:
+                fields = next(csv.reader([line], strict=True))
+            except csv.Error:
+                errors[r] = "unterminated quoted field (fields cannot span lines)"
+                continue
+            if len(fields) < self._min_fields or len(fields) > self._n_fields:
+                errors[r] = f"expected {self._n_fields} fields, got {len(fields)}"
+                continue
+            values = [fields[i].strip() or "0" for i in self._source]
+            if not all(v in ("0", "1") for v in values):
+                errors[r] = "symptom values must be 0 or 1"
+                continue
+            X[r, self._target] = [v == "1" for v in values]
+            if self._label is not None and self._label < len(fields):
+                labels[r] = fields[self._label]
+
+        ok = [r for r in range(len(lines)) if r not in errors]
+        differentials = dict(zip(ok, model1.predict_encoded_topk(X[ok], self.k, self.model))) if ok else {}
+        out = []
+        for r in range(len(lines)):
+            row = self.rows_seen + r
+            if r in errors:
+                record = {"row": row, "error": errors[r]}
+            else:
+                d = differentials[r]
+                record = {"row": row, "prediction": d[0]["disease"], "differential": d}
+                if labels[r] is not None:
+                    record["label"] = labels[r]
+            out.append(json.dumps(record, ensure_ascii=False))
+        self.rows_seen += len(lines)
+        self.errors += len(errors)
+        return ("\n".join(out) + "\n").encode("utf-8") if out else b""
+
+    def _take_line(self, raw):
+        try:
+            line = raw.decode("utf-8-sig" if self._header is None else "utf-8").rstrip("\r")
+        except UnicodeDecodeError:
+            if self._header is None:
+                raise UploadError("CSV header is not valid UTF-8; re-export the file as UTF-8")
+            # Kept as a placeholder so the row still gets its own error record
+            line = None
+        if self._header is None:
+            self._parse_header(line)
+        elif line is None or line.strip():
+            self._lines.append(line)
+
+    def feed(self, data):
+        """Consumes the next bytes of the upload; returns NDJSON for every full chunk completed."""
+        buffer = self._partial + data
+        lines = buffer.split(b"\n")
+        self._partial = lines.pop()
+        if len(self._partial) > MAX_LINE_BYTES:
+            raise UploadError(f"CSV line longer than {MAX_LINE_BYTES} bytes")
+        out = []
+        for raw in lines:
+            self._take_line(raw)
+            if len(self._lines) >= self.chunk_rows:
+                out.append(self._score_lines())
+        return b"".join(out)
+
+    def finish(self):
+        """Scores whatever is left once the upload is complete."""
+        if self._partial:
+            self._take_line(self._partial)
+            self._partial = b""
+        if self._header is None:
+            raise UploadError("Empty upload: expected a CSV header line")
+        return self._score_lines()
+
+
+class MultipartFileReader:
+    """Extracts the first file part of a multipart/form-data body as it streams in."""
+
+    def __init__(self, content_type):
+        from multipart.multipart import MultipartParser, parse_options_header
+
+        _, params = parse_options_header(content_type)
+        boundary = params.get(b"boundary")
+        if not boundary:
+            raise UploadError("multipart/form-data upload without a boundary")
+        self._out = []
+        self._state = {"header": b"", "value": b"", "is_file": False, "done": False, "headers": {}}
+        self._parser = MultipartParser(boundary, callbacks={
+            "on_part_begin": self._part_begin,
+            "on_header_field": lambda data, start, end: self._append("header", data[start:end]),
+            "on_header_value": lambda data, start, end: self._append("value", data[start:end]),
+            "on_header_end": self._header_end,
+            "on_headers_finished": self._headers_finished,
+            "on_part_data": self._part_data,
+            "on_part_end": self._part_end,
+        })
+
+    def _append(self, name, data):
+        self._state[name] += data
+
+    def _part_begin(self):
+        self._state.update(header=b"", value=b"", is_file=False, headers={})
+
+    def _header_end(self):
+        self._state["headers"][self._state["header"].lower()] = self._state["value"]
+        self._state.update(header=b"", value=b"")
+
+    def _headers_finished(self):
+        disposition = self._state["headers"].get(b"content-disposition", b"")
+        self._state["is_file"] = not self._state["done"] and b"filename=" in disposition
+
+    def _part_data(self, data, start, end):
+        if self._state["is_file"]:
+            self._out.append(data[start:end])
+
+    def _part_end(self):
+        if self._state["is_file"]:
+            self._state["done"] = True
+            self._state["is_file"] = False
+
+    def feed(self, data):
+        """Parses the next body bytes; returns the file content they contained."""
+        self._parser.write(data)
+        out, self._out = b"".join(self._out), []
+        return out
+
+    def finish(self):
+        self._parser.finalize()
+        if not self._state["done"] and not self._out:
+            raise UploadError("multipart upload has no file part")
+        out, self._out = b"".join(self._out), []
+        return out
+
+
+def body_decoder(content_type):
+    """Returns a (feed, finish) pair that turns raw request body bytes into CSV bytes."""
+    if content_type and content_type.lower().startswith("multipart/form-data"):
+        reader = MultipartFileReader(content_type)
+        return reader.feed, reader.finish
+    return (lambda data: data), (lambda: b"")
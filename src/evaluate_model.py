@@ -0,0 +1,288 @@
+#!/usr/bin/env python3
+"""
+Model evaluation CLI.
+
+  python src/evaluate_model.py cv Training.csv --folds 5 --workers 4
+      k-fold cross-validation of the training setup, one fold per worker process.
+
+  python src/evaluate_model.py score history.csv --chunk-size 50000 --workers 8
+      Scores a labelled CSV (same columns as Training.csv) with the live model. The file
+      is read in chunks and each chunk is scored in a worker process that memory-maps the
+      engine, so memory stays flat however large the file is.
+
+Both report accuracy, per-class precision/recall/F1, throughput and latency, and can
+write everything as JSON with --json.
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import model1
+from forest_engine import ForestEngine
+
+DEFAULT_CHUNK_SIZE = 20000
+# Single rows timed for the per-request latency figures
+LATENCY_SAMPLE = 500
+
+
+def class_report(y_true, y_pred, classes):
+    """Accuracy plus per-class and macro precision/recall/F1 from integer labels (-1 = unknown)."""
+    n = len(classes)
+    known = (y_true >= 0) & (y_pred >= 0)
+    tp = np.bincount(y_true[known & (y_true == y_pred)], minlength=n)
+    true_count = np.bincount(y_true[y_true >= 0], minlength=n)
+    pred_count = np.bincount(y_pred[y_pred >= 0], minlength=n)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        precision = np.where(pred_count > 0, tp / pred_count, 0.0)
+        recall = np.where(true_count > 0, tp / true_count, 0.0)
+        f1 = np.where(precision + recall > 0, 2 * precision * recall / (precision + recall), 0.0)
+    present = true_count > 0
+    return {
+        "rows": int(len(y_true)),
+        "accuracy": round(float((y_true == y_pred).mean()), 4) if len(y_true) else None,
+        "unknown_labels": int((y_true < 0).sum()),
+        "macro": {
+            "precision": round(float(precision[present].mean()), 4) if present.any() else None,
+            "recall": round(float(recall[present].mean()), 4) if present.any() else None,
+            "f1": round(float(f1[present].mean()), 4) if present.any() else None,
+        },
+        "per_class": [
+            {"class": str(classes[i]), "precision": round(float(precision[i]), 4),
+             "recall": round(float(recall[i]), 4), "f1": round(float(f1[i]), 4),
+             "support": int(true_count[i])}
+            for i in range(n) if true_count[i] or pred_count[i]
+        ],
+    }
+
+
+def latency_report(engine, X, sample=LATENCY_SAMPLE):
+    """p50/p99/max single-row latency in ms over up to sample rows of X."""
+    rows = X[np.arange(min(sample, len(X)))]
+    timings = []
+    for i in range(len(rows)):
+        start = time.perf_counter()
+        engine.predict_proba(rows[i:i + 1])
+        timings.append((time.perf_counter() - start) * 1000)
+    if not timings:
+        return None
+    p50, p99, worst = np.percentile(timings, [50, 99, 100])
+    return {"p50_ms": round(float(p50), 3), "p99_ms": round(float(p99), 3), "max_ms": round(float(worst), 3)}
+
+
+def print_report(title, report):
+    print(f"\n{title}")
+    print(f"{'class':<42}{'precision':>10}{'recall':>10}{'f1':>10}{'support':>10}")
+    for row in report["per_class"]:
+        print(f"{row['class'][:41]:<42}{row['precision']:>10.4f}{row['recall']:>10.4f}"
+              f"{row['f1']:>10.4f}{row['support']:>10}")
+    macro = report["macro"]
+    print(f"{'macro avg':<42}{macro['precision'] or 0:>10.4f}{macro['recall'] or 0:>10.4f}"
+          f"{macro['f1'] or 0:>10.4f}{report['rows']:>10}")
+    print(f"accuracy: {report['accuracy']}  rows: {report['rows']}  unknown labels: {report['unknown_labels']}")
+
+
+# --- cross-validation -----------------------------------------------------------------------
+
+def _run_fold(X, y, train_idx, test_idx, n_estimators, max_depth, dedupe, classes):
+    """Fits one fold (single-threaded; folds run in parallel) and scores it with the serving engine."""
+    clf, n_rows, fit_time = model1._fit_forest(X[train_idx], classes[y[train_idx]], dedupe=dedupe, n_jobs=1,
+                                               n_estimators=n_estimators, max_depth=max_depth)
+    engine = ForestEngine.from_sklearn(clf)
+    class_index = {c: i for i, c in enumerate(classes)}
+    # The fold's forest may not know every class; map its columns back onto the full class list
+    engine_to_full = np.array([class_index[c] for c in engine.classes])
+    X_test = np.ascontiguousarray(X[test_idx])
+    start = time.perf_counter()
+    proba = engine.predict_proba(X_test)
+    score_time = time.perf_counter() - start
+    pred = engine_to_full[np.argmax(proba, axis=1)]
+    return {
+        "test_idx": test_idx,
+        "pred": pred,
+        "accuracy": round(float((pred == y[test_idx]).mean()), 4),
+        "test_rows": len(test_idx),
+        "fit_time_s": round(fit_time, 3),
+        "fit_rows": n_rows,
+        "score_rows_per_s": round(len(X_test) / score_time, 1) if score_time else None,
+        "latency": latency_report(engine, X_test),
+    }
+
+
+def cross_validate(csv_path, folds=5, workers=None, n_estimators=200, max_depth=None,
+                   dedupe=True, group_duplicates=True, seed=42):
+    """Stratified k-fold CV; with group_duplicates identical rows never straddle train and test."""
+    from sklearn.model_selection import StratifiedKFold, StratifiedGroupKFold
+
+    data = model1.load_dataset(csv_path)
+    X = np.ascontiguousarray(data.X)
+    y = np.asarray(data.y)
+    if group_duplicates:
+        # Training.csv repeats each distinct symptom row many times; random folds would
+        # mostly test on rows the forest was trained on
+        _, groups = np.unique(np.column_stack([X, y]), axis=0, return_inverse=True)
+        splits = StratifiedGroupKFold(n_splits=folds, shuffle=True, random_state=seed).split(X, y, groups.ravel())
+    else:
+        splits = StratifiedKFold(n_splits=folds, shuffle=True, random_state=seed).split(X, y)
+
+    start = time.perf_counter()
+    y_pred = np.full(len(y), -1)
+    fold_results = []
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(_run_fold, X, y, train_idx, test_idx, n_estimators, max_depth, dedupe, data.classes)
+                   for train_idx, test_idx in splits]
+        for future in futures:
+            fold = future.result()
+            y_pred[fold.pop("test_idx")] = fold.pop("pred")
+            fold_results.append(fold)
+    elapsed = time.perf_counter() - start
+
+    report = class_report(y, y_pred, data.classes)
+    report.update({
+        "folds": fold_results,
+        "settings": {"folds": folds, "n_estimators": n_estimators, "max_depth": max_depth,
+                     "dedupe": dedupe, "group_duplicates": group_duplicates},
+        "wall_time_s": round(elapsed, 3),
+    })
+    return report
+
+
+# --- bulk scoring ---------------------------------------------------------------------------
+
+_worker_engine = None
+
+
+def _init_worker(engine_path):
+    global _worker_engine
+    _worker_engine = ForestEngine.load(engine_path)
+
+
+def _score_chunk(X):
+    """Scores one chunk in a worker; returns class indices and the engine time in seconds."""
+    start = time.perf_counter()
+    pred = np.argmax(_worker_engine.predict_proba(X), axis=1).astype(np.int32)
+    return pred, time.perf_counter() - start
+
+
+def _read_chunks(csv_path, symptom_cols, classes, chunk_size):
+    """Yields (X uint8, y class index or -1) per chunk of a labelled symptom CSV."""
+    import pandas as pd
+
+    class_index = {c: i for i, c in enumerate(classes)}
+    warned = False
+    for frame in pd.read_csv(csv_path, chunksize=chunk_size):
+        frame = frame.loc[:, ~frame.columns.str.contains("^Unnamed")]
+        missing = [c for c in symptom_cols if c not in frame.columns]
+        if missing and not warned:
+            print(f"⚠  {len(missing)} model symptom columns missing from {csv_path}; treating them as absent")
+            warned = True
+        X = frame.reindex(columns=symptom_cols, fill_value=0).to_numpy(dtype=np.uint8)
+        y = frame[model1.TARGET].map(class_index).fillna(-1).to_numpy(dtype=np.int64)
+        yield X, y
+
+
+def score_csv(csv_path, workers=None, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Scores a labelled CSV with the live model across a process pool, reading it chunk by chunk."""
+    paths = model1._artifact_paths(model1.current_version())
+    engine, symptom_cols = model1.load_engine(paths)
+    classes = [str(c) for c in engine.classes]
+    workers = workers or os.cpu_count()
+
+    y_true, y_pred, chunk_times = [], [], []
+    start = time.perf_counter()
+    first_sample = None
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                             initargs=(paths["engine"],)) as pool:
+        in_flight = {}
+        chunks = _read_chunks(csv_path, symptom_cols, classes, chunk_size)
+        for X, y in chunks:
+            if first_sample is None:
+                first_sample = X[:LATENCY_SAMPLE].copy()
+            # At most two chunks per worker are held in memory at any time
+            while len(in_flight) >= 2 * workers:
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    pred, seconds = future.result()
+                    y_true.append(in_flight.pop(future))
+                    y_pred.append(pred)
+                    chunk_times.append(seconds)
+            in_flight[pool.submit(_score_chunk, X)] = y
+        for future in list(in_flight):
+            pred, seconds = future.result()
+            y_true.append(in_flight.pop(future))
+            y_pred.append(pred)
+            chunk_times.append(seconds)
+    elapsed = time.perf_counter() - start
+
+    y_true = np.concatenate(y_true) if y_true else np.zeros(0, dtype=np.int64)
+    y_pred = np.concatenate(y_pred) if y_pred else np.zeros(0, dtype=np.int64)
+    report = class_report(y_true, y_pred, classes)
+    report.update({
+        "model_version": model1.current_version(),
+        "workers": workers,
+        "chunk_size": chunk_size,
+        "chunks": len(chunk_times),
+        "wall_time_s": round(elapsed, 3),
+        "rows_per_s": round(len(y_true) / elapsed, 1) if elapsed else None,
+        "chunk_p50_ms": round(float(np.percentile(chunk_times, 50)) * 1000, 2) if chunk_times else None,
+        "chunk_p99_ms": round(float(np.percentile(chunk_times, 99)) * 1000, 2) if chunk_times else None,
+        "single_row_latency": latency_report(engine, first_sample) if first_sample is not None else None,
+    })
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Evaluate the disease prediction model.")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    cv = sub.add_parser("cv", help="k-fold cross-validation of the training setup")
+    cv.add_argument("csv", help="labelled training CSV, e.g. Training.csv")
+    cv.add_argument("--folds", type=int, default=5)
+    cv.add_argument("--workers", type=int, default=None, help="parallel folds (default: CPU count)")
+    cv.add_argument("--trees", type=int, default=200)
+    cv.add_argument("--depth", type=int, default=None)
+    cv.add_argument("--no-dedupe", action="store_true", help="fit on every row instead of weighted distinct rows")
+    cv.add_argument("--no-group-duplicates", action="store_true",
+                    help="let identical rows fall into both train and test folds")
+    cv.add_argument("--seed", type=int, default=42)
+    cv.add_argument("--json", help="also write the full report to this file")
+
+    score = sub.add_parser("score", help="score a labelled CSV with the live model")
+    score.add_argument("csv", help="labelled CSV with the same columns as Training.csv")
+    score.add_argument("--workers", type=int, default=None, help="worker processes (default: CPU count)")
+    score.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE)
+    score.add_argument("--json", help="also write the full report to this file")
+
+    args = parser.parse_args(argv)
+    if args.command == "cv":
+        report = cross_validate(args.csv, folds=args.folds, workers=args.workers, n_estimators=args.trees,
+                                max_depth=args.depth, dedupe=not args.no_dedupe,
+                                group_duplicates=not args.no_group_duplicates, seed=args.seed)
+        print_report(f"{args.folds}-fold cross-validation of {args.csv}", report)
+        for k, fold in enumerate(report["folds"]):
+            print(f"fold {k}: accuracy {fold['accuracy']}  test rows {fold['test_rows']}  "
+                  f"fit {fold['fit_time_s']}s on {fold['fit_rows']} rows  "
+                  f"{fold['score_rows_per_s']} rows/s  latency {fold['latency']}")
+        print(f"wall time: {report['wall_time_s']}s")
+    else:
+        report = score_csv(args.csv, workers=args.workers, chunk_size=args.chunk_size)
+        print_report(f"Model {report['model_version'] or 'model_rf.pkl'} on {args.csv}", report)
+        print(f"{report['rows']} rows in {report['wall_time_s']}s ({report['rows_per_s']} rows/s, "
+              f"{report['workers']} workers, {report['chunks']} chunks of {report['chunk_size']})")
+        print(f"chunk latency p50/p99: {report['chunk_p50_ms']}/{report['chunk_p99_ms']} ms  "
+              f"single row: {report['single_row_latency']}")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+    return report
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,144 @@
+"""
+Flattened random-forest inference engine.
+
+The trees of a fitted RandomForestClassifier are copied into a handful of
+contiguous NumPy arrays so a whole batch of rows can be walked through every
+tree at once, without scikit-learn being importable at serving time.
+
+The arrays are saved as one .npy file each and memory-mapped read-only on load,
+so every worker process on a host shares a single copy through the page cache.
+"""
+
+import os
+import shutil
+
+import numpy as np
+
+# Upper bound on rows * trees * classes materialised per chunk while averaging leaves
+_CHUNK_ELEMENTS = 2_000_000
+
+
+class ForestEngine:
+    """Walks all trees of a flattened forest for a batch of rows at once."""
+
+    ARRAYS = ("feature", "threshold", "children", "leaf_index", "leaf_value", "roots")
+
+    def __init__(self, feature, threshold, children, leaf_index, leaf_value, roots, classes):
+        self.feature = feature          # int32  (n_nodes,)  split feature; 0 for leaves
+        self.threshold = threshold      # float32 (n_nodes,) go right when x > threshold
+        self.children = children        # int32  (n_nodes, 2) global (left, right) node ids, -1 for leaves
+        self.leaf_index = leaf_index    # int32  (n_nodes,)  row in leaf_value, -1 for split nodes
+        self.leaf_value = leaf_value    # float32 (n_leaves, n_classes) normalised class distributions
+        self.roots = roots              # int32  (n_trees,)  root node id of each tree
+        self.classes = classes          # str    (n_classes,)
+
+    @classmethod
+    def from_sklearn(cls, clf):
+        """Flattens a fitted RandomForestClassifier into contiguous node arrays."""
+        features, thresholds, children, leaf_indexes, leaf_values, roots = [], [], [], [], [], []
+        node_offset = 0
+        leaf_offset = 0
+        for est in clf.estimators_:
+            tree = est.tree_
+            n = tree.node_count
+            is_leaf = tree.children_left == -1
+
+            features.append(np.where(is_leaf, 0, tree.feature))
+            thresholds.append(np.where(is_leaf, 0.0, tree.threshold))
+            pairs = np.stack([tree.children_left, tree.children_right], axis=1) + node_offset
+            children.append(np.where(is_leaf[:, None], -1, pairs))
+
+            leaf_ids = np.full(n, -1)
+            leaf_ids[is_leaf] = np.arange(is_leaf.sum()) + leaf_offset
+            leaf_indexes.append(leaf_ids)
+
+            counts = tree.value[is_leaf, 0, :]
+            leaf_values.append(counts / counts.sum(axis=1, keepdims=True))
+
+            roots.append(node_offset)
+            node_offset += n
+            leaf_offset += int(is_leaf.sum())
+
+        return cls(
+            feature=np.concatenate(features).astype(np.int32),
+            threshold=np.concatenate(thresholds).astype(np.float32),
+            children=np.concatenate(children).astype(np.int32),
+            leaf_index=np.concatenate(leaf_indexes).astype(np.int32),
+            leaf_value=np.concatenate(leaf_values).astype(np.float32),
+            roots=np.array(roots, dtype=np.int32),
+            classes=np.asarray(clf.classes_).astype(str),
+        )
+
+    def save(self, path):
+        """Writes one .npy file per array into the directory path, replacing it atomically."""
+        tmp_path = f"{path}.tmp-{os.getpid()}"
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        os.makedirs(tmp_path)
+        for name in self.ARRAYS + ("classes",):
+            np.save(os.path.join(tmp_path, f"{name}.npy"), np.ascontiguousarray(getattr(self, name)))
+        shutil.rmtree(path, ignore_errors=True)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path, mmap=True):
+        """Loads an engine written by save(), memory-mapping the node arrays unless mmap=False."""
+        mode = "r" if mmap else None
+        arrays = {name: np.load(os.path.join(path, f"{name}.npy"), mmap_mode=mode, allow_pickle=False)
+                  for name in cls.ARRAYS}
+        classes = np.load(os.path.join(path, "classes.npy"), allow_pickle=False)
+        return cls(classes=classes, **arrays)
+
+    @property
+    def n_trees(self):
+        return len(self.roots)
+
+    @property
+    def nbytes(self):
+        return sum(getattr(self, name).nbytes for name in self.ARRAYS)
+
+    def preload(self):
+        """Reads every page of the node arrays so no later prediction waits on a page fault."""
+        for name in self.ARRAYS:
+            np.asarray(getattr(self, name)).view(np.uint8).sum(dtype=np.uint64)
+
+    def _leaves(self, X):
+        """Returns the leaf node reached by every row in every tree, shape (n_rows, n_trees)."""
+        n_rows, n_features = X.shape
+        flat_x = np.ascontiguousarray(X).ravel()
+        flat_children = self.children.ravel()
+        node = np.tile(self.roots, n_rows)
+        row_base = np.repeat(np.arange(n_rows) * n_features, self.n_trees)
+        # Only (row, tree) pairs still sitting on a split node are advanced each step,
+        # so a few very deep trees do not make every shallow tree walk their depth
+        active = np.flatnonzero(self.leaf_index[node] < 0)
+        while active.size:
+            current = node[active]
+            go_right = flat_x[row_base[active] + self.feature[current]] > self.threshold[current]
+            current = flat_children[2 * current + go_right]
+            node[active] = current
+            active = active[self.leaf_index[current] < 0]
+        return node.reshape(n_rows, self.n_trees)
+
+    def predict_proba(self, X):
+        """Averages the leaf class distributions over all trees, like sklearn's predict_proba."""
+        X = np.atleast_2d(np.asarray(X))
+        proba = np.empty((X.shape[0], len(self.classes)), dtype=np.float64)
+        step = max(1, _CHUNK_ELEMENTS // (self.n_trees * len(self.classes)))
+        for start in range(0, X.shape[0], step):
+            leaves = self._leaves(X[start:start + step])
+            proba[start:start + step] = self.leaf_value[self.leaf_index[leaves]].mean(axis=1, dtype=np.float64)
+        return proba
+
+    def predict(self, X):
+        """Returns the most probable class label for each row."""
+        return self.classes[np.argmax(self.predict_proba(X), axis=1)]
+
+    def top_k(self, X, k=3):
+        """Returns, per row, up to k (label, probability) pairs sorted by probability."""
+        proba = self.predict_proba(X)
+        k = max(1, min(int(k), len(self.classes)))
+        order = np.argsort(-proba, axis=1, kind="stable")[:, :k]
+        return [
+            [(str(self.classes[j]), float(p[j])) for j in idx if p[j] > 0 or j == idx[0]]
+            for p, idx in zip(proba, order)
+        ]
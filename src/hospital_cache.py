@@ -0,0 +1,140 @@
+"""
+Geohash-tiled cache of upstream hospital results.
+
+Callers are snapped to a geohash tile and the upstream is asked once per tile for
+every hospital around it; the raw result set is stored in SQLite, so it survives
+restarts and is shared by every caller in the tile. Distances are not stored:
+they are recomputed for each caller's exact position.
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+
+_BASE32 = "0123456789bcdefghjkmnpqrstuvwxyz"
+
+
+def geohash_encode(latitude, longitude, precision):
+    """Standard base-32 geohash of a point."""
+    lat_lo, lat_hi = -90.0, 90.0
+    lon_lo, lon_hi = -180.0, 180.0
+    chars = []
+    bits = 0
+    n_bits = 0
+    even = True
+    while len(chars) < precision:
+        if even:
+            mid = (lon_lo + lon_hi) / 2
+            bit = longitude >= mid
+            lon_lo, lon_hi = (mid, lon_hi) if bit else (lon_lo, mid)
+        else:
+            mid = (lat_lo + lat_hi) / 2
+            bit = latitude >= mid
+            lat_lo, lat_hi = (mid, lat_hi) if bit else (lat_lo, mid)
+        bits = (bits << 1) | bit
+        n_bits += 1
+        even = not even
+        if n_bits == 5:
+            chars.append(_BASE32[bits])
+            bits = n_bits = 0
+    return "".join(chars)
+
+
+def geohash_bounds(tile):
+    """(lat_lo, lat_hi, lon_lo, lon_hi) of a geohash tile."""
+    lat_lo, lat_hi = -90.0, 90.0
+    lon_lo, lon_hi = -180.0, 180.0
+    even = True
+    for ch in tile:
+        value = _BASE32.index(ch)
+        for shift in range(4, -1, -1):
+            bit = (value >> shift) & 1
+            if even:
+                mid = (lon_lo + lon_hi) / 2
+                lon_lo, lon_hi = (mid, lon_hi) if bit else (lon_lo, mid)
+            else:
+                mid = (lat_lo + lat_hi) / 2
+                lat_lo, lat_hi = (mid, lat_hi) if bit else (lat_lo, mid)
+            even = not even
+    return lat_lo, lat_hi, lon_lo, lon_hi
+
+
+class TileCache:
+    """SQLite store of upstream results per geohash tile, with a TTL and a cap on stored tiles.
+
+    Once more than max_tiles are stored, the least recently used ones are evicted.
+    """
+
+    def __init__(self, path, ttl_s, max_tiles):
+        self.path = path
+        self.ttl_s = ttl_s
+        self.max_tiles = max_tiles
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "expired": 0, "stores": 0, "evictions": 0}
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS tiles ("
+            " tile TEXT PRIMARY KEY, fetched_at REAL NOT NULL, last_used REAL NOT NULL, results TEXT NOT NULL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS tiles_last_used ON tiles (last_used)")
+
+    def get(self, tile):
+        """Cached results for a tile, or None when it is missing or older than the TTL."""
+        now = time.time()
+        with self._lock:
+            row = self._db.execute("SELECT fetched_at, results FROM tiles WHERE tile = ?", (tile,)).fetchone()
+            if row is None:
+                self.stats["misses"] += 1
+                return None
+            if now - row[0] > self.ttl_s:
+                self.stats["expired"] += 1
+                self.stats["misses"] += 1
+                return None
+            self._db.execute("UPDATE tiles SET last_used = ? WHERE tile = ?", (now, tile))
+            self.stats["hits"] += 1
+        return json.loads(row[1])
+
+    def stale(self, tile):
+        """Cached results for a tile however old they are, for when the upstream cannot be asked; None if missing."""
+        with self._lock:
+            row = self._db.execute("SELECT results FROM tiles WHERE tile = ?", (tile,)).fetchone()
+        return json.loads(row[0]) if row is not None else None
+
+    def put(self, tile, results):
+        """Stores a tile's results, evicting the least recently used tiles beyond max_tiles."""
+        now = time.time()
+        payload = json.dumps(results, ensure_ascii=False)
+        with self._lock:
+            self._db.execute("INSERT OR REPLACE INTO tiles VALUES (?, ?, ?, ?)", (tile, now, now, payload))
+            self.stats["stores"] += 1
+            excess = self._db.execute("SELECT COUNT(*) FROM tiles").fetchone()[0] - self.max_tiles
+            if excess > 0:
+                self._db.execute(
+                    "DELETE FROM tiles WHERE tile IN (SELECT tile FROM tiles ORDER BY last_used LIMIT ?)",
+                    (excess,),
+                )
+                self.stats["evictions"] += excess
+
+    def clear(self):
+        with self._lock:
+            self._db.execute("DELETE FROM tiles")
+
+    def info(self):
+        """Hit/miss counters, hit rate and the number of stored tiles."""
+        with self._lock:
+            tiles = self._db.execute("SELECT COUNT(*) FROM tiles").fetchone()[0]
+            stats = dict(self.stats)
+        lookups = stats["hits"] + stats["misses"]
+        return {
+            "path": self.path,
+            "tiles": tiles,
+            "max_tiles": self.max_tiles,
+            "ttl_s": self.ttl_s,
+            **stats,
+            "hit_rate": round(stats["hits"] / lookups, 4) if lookups else None,
+        }
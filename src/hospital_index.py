@@ -0,0 +1,193 @@
+"""
+Offline hospital spatial index.
+
+Hospitals from a local CSV or GeoJSON extract (e.g. OSM amenity=hospital) are
+bucketed into a fixed latitude/longitude grid. A query only computes distances,
+vectorised with numpy, for the points in the grid cells that can lie within the
+search radius; k-nearest queries widen the radius until k hospitals are inside it.
+"""
+
+import csv
+import json
+import math
+import os
+
+import numpy as np
+
+EARTH_RADIUS_KM = 6371.0
+# Grid cell size in degrees (about 28 km of latitude)
+GRID_CELL_DEG = 0.25
+_KM_PER_DEG = math.pi * EARTH_RADIUS_KM / 180
+_HALF_CIRCUMFERENCE_KM = math.pi * EARTH_RADIUS_KM
+
+_LAT_FIELDS = ("latitude", "lat", "y")
+_LON_FIELDS = ("longitude", "lon", "lng", "x")
+_ADDRESS_PARTS = ("addr:housenumber", "addr:street", "addr:suburb", "addr:city", "addr:postcode")
+
+
+def haversine_km_many(lat, lon, lats, lons):
+    """Great-circle distances in km from one point to arrays of points, all in degrees."""
+    lat1, lon1 = math.radians(lat), math.radians(lon)
+    lat2, lon2 = np.radians(lats), np.radians(lons)
+    a = np.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+
+def _address(props):
+    address = props.get("address") or props.get("addr:full") or props.get("display_name")
+    if address:
+        return str(address)
+    return ", ".join(str(props[k]) for k in _ADDRESS_PARTS if props.get(k))
+
+
+def _point(geometry):
+    """(lat, lon) of a GeoJSON geometry: the point itself, or the mean vertex of a polygon's outer ring."""
+    kind = geometry.get("type")
+    coords = geometry.get("coordinates")
+    if kind == "Point":
+        return coords[1], coords[0]
+    if kind == "Polygon":
+        ring = coords[0]
+    elif kind == "MultiPolygon":
+        ring = coords[0][0]
+    else:
+        return None
+    ring = np.asarray(ring, dtype=np.float64)
+    return float(ring[:, 1].mean()), float(ring[:, 0].mean())
+
+
+class HospitalIndex:
+    """Grid-bucketed hospital coordinates with radius and k-nearest queries."""
+
+    def __init__(self, names, addresses, lats, lons, cell_deg=GRID_CELL_DEG):
+        lats = np.asarray(lats, dtype=np.float64)
+        lons = np.asarray(lons, dtype=np.float64)
+        lons = np.where((lons < -180.0) | (lons >= 180.0), (lons + 180.0) % 360.0 - 180.0, lons)
+        self.cell_deg = cell_deg
+        self.n_rows = int(math.ceil(180.0 / cell_deg))
+        self.n_cols = int(math.ceil(360.0 / cell_deg))
+
+        # Points sorted by cell so each cell is one contiguous slice
+        cells = self._cell_row(lats) * self.n_cols + self._cell_col(lons)
+        order = np.argsort(cells, kind="stable")
+        self.lats = lats[order]
+        self.lons = lons[order]
+        self.names = [names[i] for i in order]
+        self.addresses = [addresses[i] for i in order]
+        cells = cells[order]
+        starts = np.flatnonzero(np.r_[True, cells[1:] != cells[:-1]]) if len(cells) else np.array([], dtype=int)
+        ends = np.r_[starts[1:], len(cells)]
+        self._cells = {int(cells[s]): (int(s), int(e)) for s, e in zip(starts, ends)}
+
+    def __len__(self):
+        return len(self.names)
+
+    def _cell_row(self, lats):
+        return np.clip(((lats + 90.0) // self.cell_deg).astype(np.int64), 0, self.n_rows - 1)
+
+    def _cell_col(self, lons):
+        return ((lons + 180.0) // self.cell_deg).astype(np.int64) % self.n_cols
+
+    def _row_of(self, lat):
+        return min(max(int((lat + 90.0) // self.cell_deg), 0), self.n_rows - 1)
+
+    def _col_of(self, lon):
+        return int((lon + 180.0) // self.cell_deg)
+
+    @classmethod
+    def from_csv(cls, path):
+        """Reads a CSV with name, optional address and latitude/longitude (or lat/lon) columns."""
+        names, addresses, lats, lons = [], [], [], []
+        with open(path, newline="", encoding="utf-8-sig") as f:
+            reader = csv.DictReader(f)
+            fields = {name.strip().lower(): name for name in reader.fieldnames or ()}
+            lat_field = next((fields[k] for k in _LAT_FIELDS if k in fields), None)
+            lon_field = next((fields[k] for k in _LON_FIELDS if k in fields), None)
+            if lat_field is None or lon_field is None:
+                raise ValueError(f"{path}: expected latitude and longitude columns")
+            for row in reader:
+                try:
+                    lat, lon = float(row[lat_field]), float(row[lon_field])
+                except (TypeError, ValueError):
+                    continue
+                props = {k.strip().lower(): v for k, v in row.items() if k}
+                names.append(props.get("name") or "Unknown Hospital")
+                addresses.append(_address(props))
+                lats.append(lat)
+                lons.append(lon)
+        return cls(names, addresses, lats, lons)
+
+    @classmethod
+    def from_geojson(cls, path):
+        """Reads a GeoJSON FeatureCollection of Point (or Polygon) features with a name property."""
+        with open(path, encoding="utf-8") as f:
+            collection = json.load(f)
+        names, addresses, lats, lons = [], [], [], []
+        for feature in collection.get("features", ()):
+            point = _point(feature.get("geometry") or {})
+            if point is None:
+                continue
+            props = feature.get("properties") or {}
+            names.append(props.get("name") or "Unknown Hospital")
+            addresses.append(_address(props))
+            lats.append(point[0])
+            lons.append(point[1])
+        return cls(names, addresses, lats, lons)
+
+    @classmethod
+    def load(cls, path):
+        """Loads a .csv or .geojson/.json hospital file."""
+        if os.path.splitext(path)[1].lower() in (".geojson", ".json"):
+            return cls.from_geojson(path)
+        return cls.from_csv(path)
+
+    def _candidates(self, lat, lon, radius_km):
+        """Indices of the points in every grid cell that may lie within radius_km."""
+        if radius_km >= _HALF_CIRCUMFERENCE_KM:
+            return np.arange(len(self.names))
+        dlat = radius_km / _KM_PER_DEG
+        lat_lo, lat_hi = max(lat - dlat, -90.0), min(lat + dlat, 90.0)
+        row_lo, row_hi = self._row_of(lat_lo), self._row_of(lat_hi)
+        # The widest longitude span is at the row edge nearest a pole
+        max_abs_lat = max(abs(lat_lo), abs(lat_hi))
+        cos_lat = math.cos(math.radians(max_abs_lat)) if max_abs_lat < 90.0 else 0.0
+        if cos_lat * 180.0 <= radius_km / _KM_PER_DEG:
+            cols = range(self.n_cols)
+        else:
+            dlon = radius_km / (_KM_PER_DEG * cos_lat)
+            col_lo = self._col_of(lon - dlon)
+            cols = [col % self.n_cols for col in range(col_lo, self._col_of(lon + dlon) + 1)]
+        slices = [self._cells.get(row * self.n_cols + col) for row in range(row_lo, row_hi + 1) for col in cols]
+        slices = [s for s in slices if s is not None]
+        if not slices:
+            return np.array([], dtype=np.intp)
+        return np.concatenate([np.arange(s, e) for s, e in slices])
+
+    def within(self, lat, lon, radius_km, k=None):
+        """(indices, distances in km) of the hospitals within radius_km, nearest first; at most k if given."""
+        idx = self._candidates(lat, lon, radius_km)
+        dist = haversine_km_many(lat, lon, self.lats[idx], self.lons[idx])
+        keep = np.flatnonzero(dist <= radius_km)
+        if k is not None and len(keep) > k:
+            keep = keep[np.argpartition(dist[keep], k - 1)[:k]]
+        order = keep[np.argsort(dist[keep], kind="stable")]
+        return idx[order], dist[order]
+
+    def nearest(self, lat, lon, k, max_km=None):
+        """(indices, distances in km) of the k nearest hospitals, optionally only those within max_km."""
+        limit = _HALF_CIRCUMFERENCE_KM if max_km is None else max_km
+        radius = min(self.cell_deg * _KM_PER_DEG, limit)
+        while True:
+            idx, dist = self.within(lat, lon, radius, k)
+            if len(idx) >= k or radius >= limit:
+                return idx, dist
+            radius = min(radius * 2, limit)
+
+    def query(self, lat, lon, k, max_km=None):
+        """The k nearest hospitals as {"name", "address", "latitude", "longitude", "distance_km"} dicts."""
+        idx, dist = self.nearest(lat, lon, k, max_km)
+        return [
+            {"name": self.names[i], "address": self.addresses[i], "latitude": float(self.lats[i]),
+             "longitude": float(self.lons[i]), "distance_km": round(float(d), 2)}
+            for i, d in zip(idx, dist)
+        ]
@@ -0,0 +1,322 @@
+"""
+Nearby hospital lookup: a local hospital index first, OpenStreetMap Nominatim second.
+
+When a hospital dataset is configured (see hospital_index), queries are answered
+offline from it and Nominatim is only consulted, if enabled, to top up a result
+with fewer hospitals than asked for. Without one, Nominatim is the source.
+
+One keep-alive httpx.AsyncClient is shared by every request. Its connection pool
+caps how many upstream calls are in flight at once, and strict connect, read and
+pool timeouts bound how long a caller can wait. A slow or failing Nominatim then
+costs /hospitals callers a few seconds and a 503, never a server worker.
+
+Upstream results are cached per geohash tile (see hospital_cache), so callers in
+the same neighbourhood share one upstream query and only distances are recomputed.
+Concurrent misses for one tile share a single in-flight call, and calls are spaced
+to Nominatim's one-per-second usage policy; a caller who would queue too long gets
+the tile's expired cache entry, or HospitalsUnavailable when there is none.
+"""
+
+import asyncio
+import os
+import sqlite3
+import threading
+from math import radians, cos, sin, asin, sqrt
+
+import httpx
+
+from hospital_cache import TileCache, geohash_bounds, geohash_encode
+from hospital_index import HospitalIndex
+from upstream import RateLimited, SingleFlight, TokenBucket
+
+NOMINATIM_URL = os.environ.get("YUVA_NOMINATIM_URL", "https://nominatim.openstreetmap.org/search")
+# Nominatim's usage policy asks for a User-Agent identifying the application, and a contact address
+USER_AGENT = os.environ.get("YUVA_NOMINATIM_USER_AGENT", "YUVA-Medical-Platform/1.0 (hospital finder)")
+NOMINATIM_EMAIL = os.environ.get("YUVA_NOMINATIM_EMAIL", "")
+# Sustained upstream calls per second, and how long a caller may queue for one before degrading
+NOMINATIM_RATE_PER_S = float(os.environ.get("YUVA_NOMINATIM_RATE_PER_S", "1"))
+NOMINATIM_MAX_WAIT_S = float(os.environ.get("YUVA_NOMINATIM_MAX_WAIT_S", "2"))
+# Half-width in degrees of the box searched around the caller
+SEARCH_DELTA_DEG = 0.4
+MAX_DISTANCE_KM = 20
+# Caps with a local dataset; Nominatim answers at most RESULT_LIMIT hospitals within its box
+MAX_RADIUS_KM = 100
+RESULT_LIMIT = 30
+MAX_RESULT_LIMIT = 100
+_KM_PER_DEG = 111.19
+# Local hospital dataset (.csv or .geojson); by default src/hospitals.csv or src/hospitals.geojson if present
+HOSPITAL_DATA_PATH = os.environ.get("YUVA_HOSPITAL_DATA") or next(
+    (path for path in (os.path.join(os.path.dirname(__file__), name) for name in ("hospitals.csv", "hospitals.geojson"))
+     if os.path.exists(path)), "")
+# Query Nominatim when the local index has fewer hospitals than asked for
+HOSPITAL_ENRICH = os.environ.get("YUVA_HOSPITAL_ENRICH", "0") != "0"
+HOSPITAL_CONNECT_TIMEOUT_S = float(os.environ.get("YUVA_HOSPITAL_CONNECT_TIMEOUT_S", "3"))
+HOSPITAL_READ_TIMEOUT_S = float(os.environ.get("YUVA_HOSPITAL_READ_TIMEOUT_S", "5"))
+# Upstream calls in flight at once; further callers queue for a connection up to the pool timeout
+HOSPITAL_MAX_CONCURRENCY = int(os.environ.get("YUVA_HOSPITAL_MAX_CONCURRENCY", "4"))
+HOSPITAL_POOL_TIMEOUT_S = float(os.environ.get("YUVA_HOSPITAL_POOL_TIMEOUT_S", "2"))
+# Geohash length of a cache tile; 5 characters is about 4.9 x 4.9 km
+HOSPITAL_TILE_PRECISION = 5
+# An empty path disables the tile cache
+HOSPITAL_CACHE_PATH = os.environ.get(
+    "YUVA_HOSPITAL_CACHE_PATH", os.path.join(os.path.dirname(__file__), ".hospital_cache", "tiles.sqlite3"))
+HOSPITAL_CACHE_TTL_S = float(os.environ.get("YUVA_HOSPITAL_CACHE_TTL_S", str(24 * 3600)))
+HOSPITAL_CACHE_MAX_TILES = int(os.environ.get("YUVA_HOSPITAL_CACHE_MAX_TILES", "10000"))
+# Retry-After suggested when Nominatim failed and nothing is cached for the caller's tile
+UPSTREAM_RETRY_AFTER_S = 5
+
+# Listed, when within the caller's radius, if Nominatim answers but finds nothing there
+FALLBACK_HOSPITALS = [
+    {
+        "name": "VIT University Health Centre",
+        "address": "VIT Chennai, Vandalur-Kelambakkam Road, Chennai",
+        "latitude": 12.8400,
+        "longitude": 80.1557
+    },
+    {
+        "name": "Apollo Hospital",
+        "address": "Perumbakkam, Chennai",
+        "latitude": 12.9126,
+        "longitude": 80.2270
+    },
+    {
+        "name": "Chettinad Hospital",
+        "address": "Kelambakkam, Chennai",
+        "latitude": 12.7852,
+        "longitude": 80.2296
+    }
+]
+
+_client = None
+_tile_cache = None
+_tile_cache_lock = threading.Lock()
+_hospital_index = None
+_hospital_index_lock = threading.Lock()
+_flights = SingleFlight()
+_limiter = TokenBucket(NOMINATIM_RATE_PER_S, burst=1, max_wait_s=NOMINATIM_MAX_WAIT_S)
+_upstream_stats = {"calls": 0, "errors": 0, "stale_served": 0, "unavailable": 0}
+
+
+class HospitalsUnavailable(Exception):
+    """Nominatim could not be asked (or failed) and nothing is cached for the caller's tile."""
+
+    def __init__(self, message, retry_after_s=UPSTREAM_RETRY_AFTER_S):
+        super().__init__(message)
+        self.retry_after_s = retry_after_s
+
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    """Great-circle distance in km between two (lat, lon) points in degrees."""
+    dlat = radians(lat2 - lat1)
+    dlon = radians(lon2 - lon1)
+    a = sin(dlat / 2) ** 2 + cos(radians(lat1)) * cos(radians(lat2)) * sin(dlon / 2) ** 2
+    return 6371 * 2 * asin(sqrt(a))
+
+
+def get_client():
+    """The shared upstream client, created on first use inside the running event loop."""
+    global _client
+    if _client is None or _client.is_closed:
+        _client = httpx.AsyncClient(
+            timeout=httpx.Timeout(HOSPITAL_READ_TIMEOUT_S, connect=HOSPITAL_CONNECT_TIMEOUT_S,
+                                  pool=HOSPITAL_POOL_TIMEOUT_S),
+            limits=httpx.Limits(max_connections=HOSPITAL_MAX_CONCURRENCY,
+                                max_keepalive_connections=HOSPITAL_MAX_CONCURRENCY),
+            headers={"User-Agent": USER_AGENT},
+        )
+    return _client
+
+
+async def close_client():
+    """Closes the shared client; call on application shutdown."""
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+
+def get_tile_cache():
+    """The shared tile cache, opened on first use; None when HOSPITAL_CACHE_PATH is empty."""
+    global _tile_cache
+    if _tile_cache is None and HOSPITAL_CACHE_PATH:
+        with _tile_cache_lock:
+            if _tile_cache is None:
+                try:
+                    _tile_cache = TileCache(HOSPITAL_CACHE_PATH, HOSPITAL_CACHE_TTL_S, HOSPITAL_CACHE_MAX_TILES)
+                except (OSError, sqlite3.Error) as e:
+                    print(f"⚠ Hospital tile cache unavailable ({e}); querying the upstream directly")
+                    _tile_cache = False
+    return _tile_cache or None
+
+
+def get_hospital_index():
+    """The local hospital index, loaded on first use; None when no dataset is configured or it fails to load."""
+    global _hospital_index
+    if _hospital_index is None and HOSPITAL_DATA_PATH:
+        with _hospital_index_lock:
+            if _hospital_index is None:
+                try:
+                    _hospital_index = HospitalIndex.load(HOSPITAL_DATA_PATH)
+                    print(f"Hospital index loaded: {len(_hospital_index)} hospitals from {HOSPITAL_DATA_PATH}")
+                except (OSError, ValueError, KeyError, TypeError, IndexError) as e:
+                    print(f"⚠ Hospital dataset {HOSPITAL_DATA_PATH} could not be loaded ({e}); using Nominatim")
+                    _hospital_index = False
+    return _hospital_index or None
+
+
+async def fetch_nominatim(latitude, longitude, delta=SEARCH_DELTA_DEG):
+    """Raw Nominatim hospital results in the box around a point; raises httpx errors on failure."""
+    params = {
+        "q": "hospital",
+        "format": "json",
+        "limit": RESULT_LIMIT,
+        "extratags": 1,
+        "addressdetails": 1,
+        "bounded": 1,
+        "viewbox": f"{longitude-delta},{latitude+delta},{longitude+delta},{latitude-delta}"
+    }
+    if NOMINATIM_EMAIL:
+        params["email"] = NOMINATIM_EMAIL
+    _upstream_stats["calls"] += 1
+    response = await get_client().get(NOMINATIM_URL, params=params)
+    response.raise_for_status()
+    return response.json()
+
+
+def nearby_from_results(results, latitude, longitude, max_km=MAX_DISTANCE_KM):
+    """Turns Nominatim results into hospital dicts within max_km of the caller."""
+    hospitals = []
+    for h in results:
+        try:
+            lat = float(h["lat"])
+            lon = float(h["lon"])
+        except (KeyError, TypeError, ValueError):
+            continue
+        dist = haversine_km(latitude, longitude, lat, lon)
+        if dist <= max_km:
+            display_name = h.get("display_name", "Unknown Hospital")
+            hospitals.append({
+                "name": display_name.split(",")[0],
+                "address": h.get("display_name", ""),
+                "latitude": lat,
+                "longitude": lon,
+                "distance_km": round(dist, 2)
+            })
+    return hospitals
+
+
+async def fetch_tile(tile):
+    """Raw upstream results covering SEARCH_DELTA_DEG around every point of a geohash tile."""
+    lat_lo, lat_hi, lon_lo, lon_hi = geohash_bounds(tile)
+    half = max(lat_hi - lat_lo, lon_hi - lon_lo) / 2
+    return await fetch_nominatim((lat_lo + lat_hi) / 2, (lon_lo + lon_hi) / 2, SEARCH_DELTA_DEG + half)
+
+
+async def _load_tile(tile, cache):
+    """Fetches a tile once a rate limiter slot is free and stores it in the cache."""
+    await _limiter.acquire()
+    results = await fetch_tile(tile)
+    if cache is not None:
+        await asyncio.to_thread(cache.put, tile, results)
+    return results
+
+
+async def upstream_hospitals(latitude, longitude, max_km=MAX_DISTANCE_KM):
+    """Nominatim hospitals within max_km of a point, through the tile cache.
+
+    When the upstream fails or the rate limiter queue is full, the tile's expired
+    cache entry is used if there is one; otherwise HospitalsUnavailable is raised.
+    """
+    cache = get_tile_cache()
+    tile = geohash_encode(latitude, longitude, HOSPITAL_TILE_PRECISION)
+    # SQLite lookups run in the threadpool so a slow disk does not stall the event loop
+    results = await asyncio.to_thread(cache.get, tile) if cache is not None else None
+    if results is None:
+        try:
+            results = await _flights.do(tile, lambda: _load_tile(tile, cache))
+        except (RateLimited, httpx.HTTPError, ValueError) as e:
+            if isinstance(e, httpx.TimeoutException):
+                print(f"⚠ Nominatim timed out ({type(e).__name__})")
+            elif not isinstance(e, RateLimited):
+                _upstream_stats["errors"] += 1
+                print(f"⚠ Nominatim request failed: {e}")
+            results = await asyncio.to_thread(cache.stale, tile) if cache is not None else None
+            if results is None:
+                _upstream_stats["unavailable"] += 1
+                retry_after_s = getattr(e, "retry_after_s", None) or UPSTREAM_RETRY_AFTER_S
+                raise HospitalsUnavailable(f"no hospital data for tile {tile}: {e}", retry_after_s) from e
+            _upstream_stats["stale_served"] += 1
+    return nearby_from_results(results, latitude, longitude, max_km)
+
+
+def _merge(hospitals, extra, limit):
+    """Adds extra hospitals not already listed (same name within ~100 m), nearest first."""
+    seen = {(h["name"].lower(), round(h["latitude"], 3), round(h["longitude"], 3)) for h in hospitals}
+    for h in extra:
+        if (h["name"].lower(), round(h["latitude"], 3), round(h["longitude"], 3)) not in seen:
+            hospitals.append(h)
+    return sorted(hospitals, key=lambda h: h["distance_km"])[:limit]
+
+
+def upstream_max_radius_km(latitude):
+    """Largest radius the SEARCH_DELTA_DEG box is sure to cover from anywhere in the caller's tile."""
+    return round(SEARCH_DELTA_DEG * _KM_PER_DEG * cos(radians(min(abs(latitude), 89.0))), 1)
+
+
+def fallback_hospitals(latitude, longitude, max_km=MAX_DISTANCE_KM):
+    """FALLBACK_HOSPITALS within max_km of the caller, with distances from the caller."""
+    hospitals = []
+    for h in FALLBACK_HOSPITALS:
+        dist = haversine_km(latitude, longitude, h["latitude"], h["longitude"])
+        if dist <= max_km:
+            hospitals.append({**h, "distance_km": round(dist, 2)})
+    return hospitals
+
+
+async def find_hospitals(latitude, longitude, limit=RESULT_LIMIT, radius_km=MAX_DISTANCE_KM):
+    """The limit nearest hospitals within radius_km of a point, nearest first.
+
+    Served from the local index when one is loaded. Otherwise from Nominatim, falling
+    back to the FALLBACK_HOSPITALS in range when it finds none; raises HospitalsUnavailable
+    when Nominatim cannot be asked and nothing is cached. Nominatim is asked for one fixed
+    box per tile, so without a local index limit is capped at RESULT_LIMIT and radius_km
+    at upstream_max_radius_km().
+    """
+    limit = max(1, min(int(limit), MAX_RESULT_LIMIT))
+    radius_km = max(0.0, min(float(radius_km), MAX_RADIUS_KM))
+    index = get_hospital_index()
+    if index is not None:
+        hospitals = index.query(latitude, longitude, limit, radius_km)
+        if HOSPITAL_ENRICH and len(hospitals) < limit:
+            try:
+                hospitals = _merge(hospitals, await upstream_hospitals(latitude, longitude, radius_km), limit)
+            except HospitalsUnavailable as e:
+                print(f"⚠ Not enriching from Nominatim: {e}")
+        return hospitals
+    limit = min(limit, RESULT_LIMIT)
+    radius_km = min(radius_km, upstream_max_radius_km(latitude))
+    hospitals = await upstream_hospitals(latitude, longitude, radius_km)
+    if not hospitals:
+        print("⚠ No hospitals from Nominatim; serving fallback hospitals in range")
+        hospitals = fallback_hospitals(latitude, longitude, radius_km)
+    return _merge([], hospitals, limit)
+
+
+def hospital_info():
+    """Hospital sources, upstream settings and tile cache metrics."""
+    cache = get_tile_cache()
+    index = get_hospital_index()
+    return {
+        "upstream": NOMINATIM_URL,
+        "max_concurrency": HOSPITAL_MAX_CONCURRENCY,
+        "rate_per_s": NOMINATIM_RATE_PER_S,
+        **_upstream_stats,
+        "coalesced": _flights.coalesced,
+        "rate_limited": _limiter.rejected,
+        "queued": _limiter.waited,
+        "tile_precision": HOSPITAL_TILE_PRECISION,
+        "dataset": HOSPITAL_DATA_PATH or None,
+        "indexed_hospitals": len(index) if index is not None else 0,
+        "enrich": HOSPITAL_ENRICH,
+        "cache": cache.info() if cache is not None else None,
+    }
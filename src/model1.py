@@ -1,74 +1,966 @@
-import pandas as pd
-from sklearn.ensemble import RandomForestClassifier
-from sklearn.metrics import classification_report, accuracy_score
+import numpy as np
 import joblib
 import os
 import io
+import threading
+import time
+import hashlib
+import json
+import shutil
+import queue
+from collections import OrderedDict
+from concurrent.futures import Future
 
+from forest_engine import ForestEngine
+from symptom_resolver import SymptomResolver, SymptomSuggester
+from triage import TriageTable
+from candidate_index import CandidateIndex
+
+# Legacy single-model artifacts; used only until the first versioned model is published
 MODEL_PATH = os.path.join(os.path.dirname(__file__), "model_rf.pkl")
+ENGINE_PATH = os.path.join(os.path.dirname(__file__), "model_engine")
 COLUMNS_PATH = os.path.join(os.path.dirname(__file__), "symptom_columns.txt")
+STATS_PATH = os.path.join(os.path.dirname(__file__), "symptom_stats.npz")
+# Versioned artifacts: models/<version>/ holds one complete model, models/CURRENT names the live one
+MODELS_DIR = os.path.join(os.path.dirname(__file__), "models")
+CURRENT_PATH = os.path.join(MODELS_DIR, "CURRENT")
+MODEL_KEEP_VERSIONS = 3
+DATASET_CACHE_DIR = os.path.join(os.path.dirname(__file__), ".dataset_cache")
 TARGET = "prognosis"
+MAX_BATCH_SIZE = 1000
+DEFAULT_TOP_K = 3
+DEFAULT_SUGGEST_LIMIT = 10
+MAX_SUGGEST_LIMIT = 50
+# Suggestions only change when the model is retrained; clients revalidate with the ETag after this
+SUGGEST_CACHE_MAX_AGE_S = 300
+# Candidate (n_estimators, max_depth) pairs swept by select_model_size, smallest first
+MODEL_SIZE_GRID = [(n, d) for n in (10, 25, 50, 100, 200) for d in (8, 12, 20, None)]
+RESULT_CACHE_SIZE = 4096
+# Micro-batching of concurrent single predictions; BATCH_MAX_ITEMS=1 scores every call inline
+BATCH_MAX_ITEMS = int(os.environ.get("YUVA_BATCH_MAX_ITEMS", "64"))
+BATCH_MAX_WAIT_MS = float(os.environ.get("YUVA_BATCH_MAX_WAIT_MS", "2"))
+MODEL_CHECK_INTERVAL_S = 2.0
+# Answer without the forest when every training row containing all the symptoms has the same disease
+INDEX_SHORTCUT = os.environ.get("YUVA_INDEX_SHORTCUT", "0") == "1"
+
+# Shared model state: loaded once per process and reused by every request thread.
+_model_lock = threading.Lock()
+_reload_lock = threading.Lock()
+_model_state = None
+_watcher = None
+_thread_rows = threading.local()
+_model_stats = {
+    "version": None,
+    "load_time_s": None,
+    "loaded_at": None,
+    "resident_bytes": None,
+    "warm_up_time_s": None,
+    "reloads": 0,
+    "last_reload_error": None,
+}
+
+# Ranked results keyed by (model signature, symptom bitmask), least recently used first.
+_cache_lock = threading.Lock()
+_result_cache = OrderedDict()
+_cache_stats = {"hits": 0, "misses": 0, "evictions": 0}
+# Predictions answered by the candidate index instead of the forest
+_index_stats = {"shortcuts": 0}
+
+class Dataset:
+    """A symptom CSV as a uint8 feature matrix plus integer-coded labels."""
 
-def train_and_save(train_csv: str, test_csv: str):
-    """Trains a RandomForestClassifier, saves it, and saves column names."""
-    train_df = pd.read_csv(train_csv)
-    test_df = pd.read_csv(test_csv)
+    def __init__(self, X, y, symptom_cols, classes):
+        self.X = X                          # uint8 (n_rows, n_symptoms), usually memory-mapped
+        self.y = y                          # int32 (n_rows,) index into classes
+        self.symptom_cols = symptom_cols
+        self.classes = classes              # str (n_classes,)
 
-    train_df = train_df.drop(columns=[c for c in train_df.columns if c.startswith("Unnamed")])
-    test_df  = test_df.drop(columns=[c for c in test_df.columns if c.startswith("Unnamed")])
+    @property
+    def labels(self):
+        return self.classes[self.y]
 
-    if TARGET not in train_df.columns:
+    def align(self, symptom_cols):
+        """Returns X with its columns reordered to match symptom_cols."""
+        if list(symptom_cols) == list(self.symptom_cols):
+            return self.X
+        position = {col: i for i, col in enumerate(self.symptom_cols)}
+        return self.X[:, [position[col] for col in symptom_cols]]
+
+def _read_dataset(csv_path: str):
+    """Reads a symptom CSV with uint8 symptom columns instead of pandas' default int64."""
+    import pandas as pd
+
+    header = pd.read_csv(csv_path, nrows=0).columns
+    columns = [c for c in header if not c.startswith("Unnamed")]
+    if TARGET not in columns:
         raise ValueError(f"Target column '{TARGET}' not found. "
-                         f"Available columns: {list(train_df.columns)}")
+                         f"Available columns: {columns}")
+    dtypes = {c: np.uint8 for c in columns if c != TARGET}
+    dtypes[TARGET] = "category"
+    return pd.read_csv(csv_path, usecols=columns, dtype=dtypes)
+
+def _file_digest(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
 
-    symptom_cols = [c for c in train_df.columns if c != TARGET]
+def _write_dataset_cache(csv_path, cache_path, digest):
+    """Parses the CSV once and stores it as X.npy / y.npy / meta.json in cache_path."""
+    df = _read_dataset(csv_path)
+    symptom_cols = [c for c in df.columns if c != TARGET]
+    labels = df[TARGET].astype(str).to_numpy()
+    classes, y = np.unique(labels, return_inverse=True)
 
-    X_train = train_df[symptom_cols]
-    y_train = train_df[TARGET]
-    X_test  = test_df[symptom_cols]
-    y_test  = test_df[TARGET]
+    tmp_path = f"{cache_path}.tmp-{os.getpid()}"
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    os.makedirs(tmp_path)
+    np.save(os.path.join(tmp_path, "X.npy"), np.ascontiguousarray(df[symptom_cols].to_numpy(np.uint8)))
+    np.save(os.path.join(tmp_path, "y.npy"), y.astype(np.int32))
+    st = os.stat(csv_path)
+    with open(os.path.join(tmp_path, "meta.json"), "w") as f:
+        json.dump({
+            "source": os.path.abspath(csv_path),
+            "sha256": digest,
+            "size": st.st_size,
+            "mtime_ns": st.st_mtime_ns,
+            "symptom_cols": symptom_cols,
+            "classes": classes.tolist(),
+        }, f)
+    shutil.rmtree(cache_path, ignore_errors=True)
+    os.replace(tmp_path, cache_path)
 
-    clf = RandomForestClassifier(
-        n_estimators=200,
-        random_state=42,
-        class_weight="balanced"
+def load_dataset(csv_path: str, cache_dir: str = DATASET_CACHE_DIR):
+    """Loads a symptom CSV through a memory-mapped binary cache, rebuilding it only when the CSV changes."""
+    name = os.path.splitext(os.path.basename(csv_path))[0]
+    cache_path = os.path.join(cache_dir, f"{name}-{hashlib.sha256(os.path.abspath(csv_path).encode()).hexdigest()[:12]}")
+    meta_path = os.path.join(cache_path, "meta.json")
+
+    meta = None
+    if os.path.exists(meta_path):
+        with open(meta_path) as f:
+            meta = json.load(f)
+        st = os.stat(csv_path)
+        # Size and mtime unchanged: skip hashing; otherwise only a real content change rebuilds
+        if (meta["size"], meta["mtime_ns"]) != (st.st_size, st.st_mtime_ns):
+            if meta["sha256"] == _file_digest(csv_path):
+                meta["size"], meta["mtime_ns"] = st.st_size, st.st_mtime_ns
+                with open(meta_path, "w") as f:
+                    json.dump(meta, f)
+            else:
+                meta = None
+    if meta is None:
+        os.makedirs(cache_dir, exist_ok=True)
+        _write_dataset_cache(csv_path, cache_path, _file_digest(csv_path))
+        with open(meta_path) as f:
+            meta = json.load(f)
+
+    return Dataset(
+        X=np.load(os.path.join(cache_path, "X.npy"), mmap_mode="r"),
+        y=np.load(os.path.join(cache_path, "y.npy"), mmap_mode="r"),
+        symptom_cols=meta["symptom_cols"],
+        classes=np.array(meta["classes"]),
     )
-    clf.fit(X_train, y_train)
+
+def _distinct_rows(X, y):
+    """Collapses identical (row, label) pairs into the distinct rows, their integer labels and counts."""
+    rows, counts = np.unique(np.column_stack([X, y]).astype(np.int32), axis=0, return_counts=True)
+    return rows[:, :-1].astype(np.uint8), rows[:, -1], counts
+
+def _merge_rows(rows, labels, counts):
+    """Sums the counts of identical (row, label) pairs, like _distinct_rows for already weighted rows."""
+    keys, inverse = np.unique(np.column_stack([rows, labels]).astype(np.int32), axis=0, return_inverse=True)
+    merged = np.bincount(inverse.ravel(), weights=counts).astype(np.int64)
+    return keys[:, :-1].astype(np.uint8), keys[:, -1], merged
+
+def _balanced_weights(labels, counts):
+    """Per-row weights matching class_weight="balanced" on the expanded data: n / (n_classes * class count)."""
+    class_counts = np.bincount(labels, weights=counts)
+    n_classes = np.count_nonzero(class_counts)
+    return counts * counts.sum() / (n_classes * class_counts[labels])
+
+def _fit_forest(X, labels, dedupe=False, n_jobs=-1, n_estimators=200, max_depth=None):
+    """Fits the forest; with dedupe, identical rows are collapsed into one weighted row."""
+    from sklearn.ensemble import RandomForestClassifier
+
+    start = time.perf_counter()
+    if dedupe:
+        classes, y = np.unique(labels, return_inverse=True)
+        rows, y_unique, counts = _distinct_rows(X, y)
+        clf = RandomForestClassifier(n_estimators=n_estimators, max_depth=max_depth,
+                                     random_state=42, n_jobs=n_jobs)
+        clf.fit(rows, classes[y_unique], sample_weight=_balanced_weights(y_unique, counts))
+        n_rows = len(rows)
+    else:
+        clf = RandomForestClassifier(
+            n_estimators=n_estimators,
+            max_depth=max_depth,
+            random_state=42,
+            class_weight="balanced",
+            n_jobs=n_jobs
+        )
+        clf.fit(X, labels)
+        n_rows = len(X)
+    return clf, n_rows, time.perf_counter() - start
+
+def _save_symptom_stats(path, symptom_cols, classes, rows, labels, counts):
+    """Writes per-symptom counts, the distinct training rows with their counts (for triage
+    and incremental training) and the symptom -> disease bitsets."""
+    tmp_path = f"{path}.tmp-{os.getpid()}.npz"
+    np.savez(tmp_path,
+             symptom_cols=np.array(symptom_cols),
+             frequency=(rows.astype(np.int64) * counts[:, None]).sum(axis=0),
+             rows=rows,
+             labels=labels.astype(np.int32),
+             counts=counts.astype(np.int64),
+             classes=np.asarray(classes),
+             disease_bits=CandidateIndex.pack(rows, labels, len(classes)))
+    os.replace(tmp_path, path)
+
+def save_symptom_stats(train_csv: str):
+    """Rebuilds the live model's symptom_stats.npz from a training CSV without retraining.
+
+    Running servers reload the model with the new stats on their next watcher check.
+    """
+    train = load_dataset(train_csv)
+    rows, labels, counts = _distinct_rows(train.X, train.y)
+    _save_symptom_stats(_artifact_paths(current_version())["stats"], train.symptom_cols,
+                        train.classes, rows, labels, counts)
+
+def current_version():
+    """Name of the live model version, or None while only the legacy artifacts exist."""
+    try:
+        with open(CURRENT_PATH) as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+def _artifact_paths(version):
+    """Paths of the pickle, engine, columns and stats of a model version (None: legacy files)."""
+    if version is None:
+        return {"model": MODEL_PATH, "engine": ENGINE_PATH, "columns": COLUMNS_PATH, "stats": STATS_PATH}
+    root = os.path.join(MODELS_DIR, version)
+    return {
+        "model": os.path.join(root, "model_rf.pkl"),
+        "engine": os.path.join(root, "engine"),
+        "columns": os.path.join(root, "symptom_columns.txt"),
+        "stats": os.path.join(root, "symptom_stats.npz"),
+        "meta": os.path.join(root, "meta.json"),
+    }
+
+def _publish_model(clf, symptom_cols, classes, rows, labels, counts, meta):
+    """Writes a complete new model version, then points CURRENT at it.
+
+    Everything is written to a hidden directory that is renamed into place before the
+    pointer moves, so a server never sees a partially written version.
+    """
+    os.makedirs(MODELS_DIR, exist_ok=True)
+    version = time.strftime("%Y%m%d-%H%M%S") + f"-{os.getpid()}-{time.time_ns() % 1000000:06d}"
+    tmp_root = os.path.join(MODELS_DIR, f".{version}.tmp")
+    os.makedirs(tmp_root)
+    paths = {name: path.replace(os.path.join(MODELS_DIR, version), tmp_root)
+             for name, path in _artifact_paths(version).items()}
+
+    joblib.dump(clf, paths["model"])
+    ForestEngine.from_sklearn(clf).save(paths["engine"])
+    with open(paths["columns"], "w") as f:
+        for col in symptom_cols:
+            f.write(col + "\n")
+    _save_symptom_stats(paths["stats"], symptom_cols, classes, rows, labels, counts)
+    with open(paths["meta"], "w") as f:
+        json.dump(dict(meta, version=version, created_at=time.time(),
+                       n_estimators=len(clf.estimators_), training_rows=int(counts.sum())), f)
+    os.replace(tmp_root, os.path.join(MODELS_DIR, version))
+
+    tmp_pointer = f"{CURRENT_PATH}.tmp-{os.getpid()}"
+    with open(tmp_pointer, "w") as f:
+        f.write(version + "\n")
+    os.replace(tmp_pointer, CURRENT_PATH)
+    _prune_versions(keep=version)
+    return version
+
+def _prune_versions(keep):
+    """Deletes all but the newest MODEL_KEEP_VERSIONS versions (never the one just published).
+
+    Servers still mapping a deleted engine keep reading it until they swap; the
+    files only disappear once unmapped.
+    """
+    versions = sorted(name for name in os.listdir(MODELS_DIR)
+                      if not name.startswith(".") and os.path.isdir(os.path.join(MODELS_DIR, name)))
+    for name in versions[:-MODEL_KEEP_VERSIONS]:
+        if name != keep:
+            shutil.rmtree(os.path.join(MODELS_DIR, name), ignore_errors=True)
+
+def _save_artifacts(clf, train, meta=None):
+    rows, labels, counts = _distinct_rows(train.X, train.y)
+    return _publish_model(clf, train.symptom_cols, train.classes, rows, labels, counts,
+                          dict(meta or {}, parent=None))
+
+def train_and_save(train_csv: str, test_csv: str, dedupe: bool = False, n_jobs: int = -1,
+                   n_estimators: int = 200, max_depth=None):
+    """Trains a RandomForestClassifier, saves it, and saves column names.
+
+    dedupe=True fits on the distinct rows of the training CSV weighted by how often
+    each occurs, which is several times faster and gives an equivalent model.
+    """
+    # Training-only dependencies; the inference path below imports neither pandas nor sklearn
+    from sklearn.metrics import classification_report, accuracy_score
+
+    train = load_dataset(train_csv)
+    test = load_dataset(test_csv)
+
+    symptom_cols = train.symptom_cols
+
+    X_test  = test.align(symptom_cols)
+    y_test  = test.labels
+
+    clf, n_rows, fit_time = _fit_forest(train.X, train.labels, dedupe=dedupe, n_jobs=n_jobs,
+                                        n_estimators=n_estimators, max_depth=max_depth)
+    print(f"Fitted {clf.n_estimators} trees on {n_rows} rows in {fit_time:.2f}s")
 
     pred = clf.predict(X_test)
     print("\nModel Accuracy:", accuracy_score(y_test, pred))
     print(classification_report(y_test, pred))
 
-    joblib.dump(clf, MODEL_PATH)
-    with open(COLUMNS_PATH, "w") as f:
-        for col in symptom_cols:
-            f.write(col + "\n")
-    print(f"Model and columns saved.")
+    version = _save_artifacts(clf, train, {"mode": "full", "dedupe": dedupe})
+    print(f"Model version {version} published.")
+
+def train_incremental(new_csv: str, n_new_trees: int = 50, test_csv: str = None, n_jobs: int = -1):
+    """Grows the live forest with n_new_trees fitted on newly labelled cases, and publishes it.
+
+    The existing trees are kept unchanged (warm start). The new ones are fitted on every
+    distinct row the model has seen so far, from its symptom_stats.npz, plus the rows of
+    new_csv, so each new tree still covers every prognosis. Cases with a prognosis the
+    model does not know need a full train_and_save.
+    """
+    version = current_version()
+    paths = _artifact_paths(version)
+    clf = joblib.load(paths["model"])
+    symptom_cols = _read_columns(paths["columns"])
+    stats = load_symptom_stats(symptom_cols, paths["stats"])
+    if stats is None or "rows" not in stats:
+        raise RuntimeError("Incremental training needs the training rows in symptom_stats.npz; "
+                           "run save_symptom_stats() on the original training CSV first")
+
+    classes = stats["classes"]
+    if list(classes) != list(clf.classes_):
+        raise RuntimeError("symptom_stats.npz classes do not match the model; run a full train_and_save")
+    new = load_dataset(new_csv)
+    new_labels = new.classes[np.unique(new.y)]
+    unknown = sorted(set(new_labels) - set(classes))
+    if unknown:
+        raise ValueError(f"New prognoses {unknown} need a full retrain with train_and_save")
+    class_index = {c: i for i, c in enumerate(classes)}
+    y_new = np.array([class_index[c] for c in new.classes])[new.y]
+    rows_new, labels_new, counts_new = _distinct_rows(new.align(symptom_cols), y_new)
+    rows, labels, counts = _merge_rows(np.vstack([stats["rows"], rows_new]),
+                                       np.concatenate([stats["labels"], labels_new]),
+                                       np.concatenate([stats["counts"], counts_new]))
+
+    start = time.perf_counter()
+    # class_weight is applied through sample_weight so it reflects the full row counts
+    clf.set_params(warm_start=True, n_estimators=len(clf.estimators_) + n_new_trees,
+                   class_weight=None, n_jobs=n_jobs)
+    clf.fit(rows, classes[labels], sample_weight=_balanced_weights(labels, counts))
+    clf.set_params(warm_start=False)
+    print(f"Added {n_new_trees} trees ({len(clf.estimators_)} total) on {len(rows)} distinct rows "
+          f"({int(counts_new.sum())} new cases) in {time.perf_counter() - start:.2f}s")
+
+    if test_csv:
+        test = load_dataset(test_csv)
+        print("Model Accuracy:", float((clf.predict(test.align(symptom_cols)) == test.labels).mean()))
+
+    version = _publish_model(clf, symptom_cols, classes, rows, labels, counts,
+                             {"mode": "incremental", "parent": version, "new_cases": int(counts_new.sum()),
+                              "source": os.path.abspath(new_csv)})
+    print(f"Model version {version} published.")
+    return version
+
+def compare_training_modes(train_csv: str, test_csv: str, n_jobs: int = -1):
+    """Fits the full and the deduplicated training paths side by side and prints accuracy and fit time."""
+    from sklearn.metrics import accuracy_score
+
+    train = load_dataset(train_csv)
+    test = load_dataset(test_csv)
+    X_test = test.align(train.symptom_cols)
+
+    results = {}
+    for mode, dedupe in (("full", False), ("dedupe", True)):
+        clf, n_rows, fit_time = _fit_forest(train.X, train.labels, dedupe=dedupe, n_jobs=n_jobs)
+        results[mode] = {
+            "rows": n_rows,
+            "fit_time_s": round(fit_time, 3),
+            "accuracy": accuracy_score(test.labels, clf.predict(X_test)),
+            "predictions": clf.predict(train.X),
+        }
+    agreement = float((results["full"].pop("predictions") == results["dedupe"].pop("predictions")).mean())
+
+    print(f"Training data in memory: {train.X.nbytes / 1e6:.2f} MB")
+    for mode, r in results.items():
+        print(f"{mode:>7}: {r['rows']:>5} rows  fit {r['fit_time_s']:.3f}s  accuracy {r['accuracy']:.4f}")
+    print(f"Agreement on training rows: {agreement:.4f}")
+    results["agreement"] = agreement
+    return results
+
+def _latency_percentiles(fn, inputs):
+    """Times fn over each input and returns (p50, p99) in milliseconds."""
+    timings = []
+    for x in inputs:
+        start = time.perf_counter()
+        fn(x)
+        timings.append((time.perf_counter() - start) * 1000)
+    p50, p99 = np.percentile(timings, [50, 99])
+    return round(float(p50), 3), round(float(p99), 3)
+
+def select_model_size(train_csv: str, test_csv: str, accuracy_floor: float = 0.97,
+                      max_single_p99_ms: float = None, max_batch_p99_ms: float = None,
+                      grid=MODEL_SIZE_GRID, batch_size: int = 256, dedupe: bool = True,
+                      save: bool = True):
+    """Sweeps forest size and depth, then saves the smallest model that meets accuracy_floor
+    within the latency budget.
+
+    Every candidate is compiled to the serving engine and scored on test_csv for accuracy,
+    p50/p99 latency of single-row and batch_size-row calls, and artifact size. Candidates
+    whose single-row or batch p99 exceeds max_single_p99_ms / max_batch_p99_ms (when given)
+    are not eligible.
+    """
+    train = load_dataset(train_csv)
+    test = load_dataset(test_csv)
+    X_test = np.ascontiguousarray(test.align(train.symptom_cols))
+    y_test = test.labels
+    single_rows = [X_test[i:i + 1] for i in np.arange(200) % len(X_test)]
+    batches = [np.resize(X_test, (batch_size, X_test.shape[1]))] * 20
+
+    results = []
+    for n_estimators, max_depth in grid:
+        clf, _, fit_time = _fit_forest(train.X, train.labels, dedupe=dedupe,
+                                       n_estimators=n_estimators, max_depth=max_depth)
+        engine = ForestEngine.from_sklearn(clf)
+        pickled = io.BytesIO()
+        joblib.dump(clf, pickled)
+        result = {
+            "n_estimators": n_estimators,
+            "max_depth": max_depth,
+            "accuracy": round(float((engine.predict(X_test) == y_test).mean()), 4),
+            "single_p50_ms": None, "single_p99_ms": None,
+            "batch_p50_ms": None, "batch_p99_ms": None,
+            "engine_bytes": engine.nbytes,
+            "pickle_bytes": pickled.getbuffer().nbytes,
+            "fit_time_s": round(fit_time, 3),
+            "clf": clf,
+        }
+        result["single_p50_ms"], result["single_p99_ms"] = _latency_percentiles(engine.predict_proba, single_rows)
+        result["batch_p50_ms"], result["batch_p99_ms"] = _latency_percentiles(engine.predict_proba, batches)
+        results.append(result)
+        print(f"trees={n_estimators:>4} depth={str(max_depth):>4}  acc={result['accuracy']:.4f}  "
+              f"single p50/p99={result['single_p50_ms']}/{result['single_p99_ms']}ms  "
+              f"batch{batch_size} p50/p99={result['batch_p50_ms']}/{result['batch_p99_ms']}ms  "
+              f"engine={result['engine_bytes'] / 1e6:.2f}MB  pickle={result['pickle_bytes'] / 1e6:.2f}MB")
+
+    accurate = [r for r in results if r["accuracy"] >= accuracy_floor]
+    if not accurate:
+        best = max(r["accuracy"] for r in results)
+        raise ValueError(f"No candidate reached accuracy {accuracy_floor}; best was {best}")
+    eligible = [r for r in accurate
+                if (max_single_p99_ms is None or r["single_p99_ms"] <= max_single_p99_ms)
+                and (max_batch_p99_ms is None or r["batch_p99_ms"] <= max_batch_p99_ms)]
+    if not eligible:
+        fastest = min(accurate, key=lambda r: r["single_p99_ms"])
+        raise ValueError(f"No candidate with accuracy >= {accuracy_floor} fits the latency budget; fastest has "
+                         f"single p99 {fastest['single_p99_ms']}ms, batch p99 {fastest['batch_p99_ms']}ms")
+    chosen = min(eligible, key=lambda r: (r["engine_bytes"], r["single_p99_ms"]))
+    print(f"Selected trees={chosen['n_estimators']} depth={chosen['max_depth']} "
+          f"(accuracy {chosen['accuracy']}, single p99 {chosen['single_p99_ms']}ms, "
+          f"{chosen['engine_bytes'] / 1e6:.2f} MB)")
+    if save:
+        version = _save_artifacts(chosen["clf"], train, {"mode": "size_sweep"})
+        print(f"Model version {version} published.")
+    for r in results:
+        r.pop("clf")
+    return chosen, results
+
+def _read_columns(path):
+    with open(path, "r") as f:
+        return [line.strip() for line in f.readlines()]
 
 def load_model():
-    """Loads the trained model and column names."""
-    clf = joblib.load(MODEL_PATH)
-    with open(COLUMNS_PATH, "r") as f:
-        symptom_cols = [line.strip() for line in f.readlines()]
-    return clf, symptom_cols
+    """Loads the live trained model and column names."""
+    paths = _artifact_paths(current_version())
+    return joblib.load(paths["model"]), _read_columns(paths["columns"])
+
+def load_engine(paths=None):
+    """Loads the flattened forest, compiling it from model_rf.pkl if the engine file is stale."""
+    paths = paths or _artifact_paths(current_version())
+    if os.path.exists(paths["engine"]) and (
+            not os.path.exists(paths["model"])
+            or os.path.getmtime(paths["engine"]) >= os.path.getmtime(paths["model"])):
+        engine = ForestEngine.load(paths["engine"])
+    else:
+        engine = ForestEngine.from_sklearn(joblib.load(paths["model"]))
+        try:
+            engine.save(paths["engine"])
+        except OSError as e:
+            print(f"⚠  Could not cache compiled engine: {e}")
+    return engine, _read_columns(paths["columns"])
+
+def load_symptom_stats(symptom_cols, path=None):
+    """Arrays of symptom_stats.npz as a dict, or None if the file is missing or stale."""
+    path = path or _artifact_paths(current_version())["stats"]
+    try:
+        with np.load(path, allow_pickle=False) as stats:
+            if stats["symptom_cols"].tolist() != list(symptom_cols):
+                print("⚠  symptom_stats.npz does not match the model columns; ignoring it")
+                return None
+            return {name: stats[name] for name in stats.files}
+    except FileNotFoundError:
+        return None
+
+def _model_signature():
+    """Identifies the live model: its version name (for legacy artifacts the pickle's mtime and size),
+    plus the mtime of its symptom_stats.npz so that save_symptom_stats() is picked up by the watcher."""
+    version = current_version()
+    try:
+        stats_mtime = os.stat(_artifact_paths(version)["stats"]).st_mtime_ns
+    except FileNotFoundError:
+        stats_mtime = None
+    if version is not None:
+        return version, stats_mtime
+    try:
+        st = os.stat(MODEL_PATH)
+        return (st.st_mtime_ns, st.st_size), stats_mtime
+    except FileNotFoundError:
+        return None
+
+class LoadedModel:
+    """Everything inference needs from one set of model artifacts."""
+
+    def __init__(self, engine, symptom_cols, signature, stats=None):
+        self.engine = engine
+        self.symptom_cols = symptom_cols
+        self.resolver = SymptomResolver(symptom_cols)
+        self.suggester = SymptomSuggester(symptom_cols, stats["frequency"] if stats else None)
+        self.triage = TriageTable.from_stats(stats, symptom_cols) if stats else None
+        self.candidates = CandidateIndex.from_stats(stats, symptom_cols) if stats else None
+        self.signature = signature
+
+def _load_shared_model():
+    version = current_version()
+    signature = _model_signature()
+    paths = _artifact_paths(version)
+    start = time.perf_counter()
+    engine, symptom_cols = load_engine(paths)
+    model = LoadedModel(engine, symptom_cols, signature, load_symptom_stats(symptom_cols, paths["stats"]))
+    _model_stats["version"] = version
+    _model_stats["load_time_s"] = round(time.perf_counter() - start, 4)
+    _model_stats["loaded_at"] = time.time()
+    _model_stats["resident_bytes"] = engine.nbytes
+    print(f"Model {version or 'model_rf.pkl'} loaded in {_model_stats['load_time_s']}s "
+          f"({_model_stats['resident_bytes'] / 1e6:.1f} MB of node arrays)")
+    return model
+
+def _warm(model):
+    """Faults in every engine page and runs one throwaway prediction."""
+    start = time.perf_counter()
+    model.engine.preload()
+    model.engine.predict_proba(np.zeros((1, len(model.symptom_cols)), dtype=np.uint8))
+    _model_stats["warm_up_time_s"] = round(time.perf_counter() - start, 4)
+
+def get_model():
+    """Returns the shared LoadedModel, loading it on first use.
+
+    Newer versions are loaded and swapped in by the background watcher, never here,
+    so only the very first call in a process can pay the load cost.
+    """
+    global _model_state
+    state = _model_state
+    if state is not None:
+        return state
+    with _model_lock:
+        if _model_state is None:
+            _model_state = _load_shared_model()
+            start_model_watcher()
+        return _model_state
+
+def reload_model():
+    """Loads the live model version if it differs from the one serving, warms it and swaps it in.
+
+    The swap is a single reference assignment: requests already running finish on the
+    model they started with and new ones get the warmed replacement. Returns True on a swap.
+    """
+    global _model_state
+    with _reload_lock:
+        if _model_state is not None and _model_signature() == _model_state.signature:
+            return False
+        model = _load_shared_model()
+        _warm(model)
+        _model_state = model
+        clear_cache()
+        _model_stats["reloads"] += 1
+        _model_stats["last_reload_error"] = None
+        return True
+
+def _watch_model():
+    failed_signature = None
+    while True:
+        time.sleep(MODEL_CHECK_INTERVAL_S)
+        signature = None
+        try:
+            signature = _model_signature()
+            if signature == _model_state.signature or signature == failed_signature:
+                continue
+            reload_model()
+        except Exception as e:
+            # Keep serving the previous model; retry once the artifacts change again
+            failed_signature = signature
+            _model_stats["last_reload_error"] = str(e)
+            print(f"⚠  Model reload failed, keeping previous model: {e}")
+
+def start_model_watcher():
+    """Starts the background thread that hot-swaps newly published model versions."""
+    global _watcher
+    if _watcher is None:
+        _watcher = threading.Thread(target=_watch_model, name="model-watcher", daemon=True)
+        _watcher.start()
+
+def warm_up():
+    """Loads the model and runs one throwaway prediction so the first request is fast."""
+    _warm(get_model())
+    return model_info()
+
+def cache_info():
+    """Reports size and hit/miss counters of the prediction result cache."""
+    with _cache_lock:
+        info = dict(_cache_stats)
+        info["size"] = len(_result_cache)
+    info["max_size"] = RESULT_CACHE_SIZE
+    lookups = info["hits"] + info["misses"]
+    info["hit_rate"] = round(info["hits"] / lookups, 4) if lookups else None
+    return info
+
+def clear_cache():
+    """Drops every cached prediction."""
+    with _cache_lock:
+        _result_cache.clear()
+
+def _process_memory():
+    """Resident, proportional and shared memory of this process in bytes (Linux only)."""
+    try:
+        with open("/proc/self/smaps_rollup") as f:
+            kb = {parts[0].rstrip(":"): int(parts[1]) for parts in map(str.split, f) if parts[-1] == "kB"}
+    except OSError:
+        return None
+    return {
+        "rss_bytes": kb.get("Rss", 0) * 1024,
+        "pss_bytes": kb.get("Pss", 0) * 1024,
+        "shared_bytes": (kb.get("Shared_Clean", 0) + kb.get("Shared_Dirty", 0)) * 1024,
+    }
+
+def model_info():
+    """Reports load time and size of the shared model for monitoring."""
+    info = dict(_model_stats)
+    info["loaded"] = _model_state is not None
+    model_path = _artifact_paths(info["version"])["model"]
+    info["model_path"] = model_path
+    info["file_bytes"] = os.path.getsize(model_path) if os.path.exists(model_path) else None
+    if _model_state is not None:
+        info["n_estimators"] = _model_state.engine.n_trees
+        info["n_features"] = len(_model_state.symptom_cols)
+        info["n_classes"] = len(_model_state.engine.classes)
+        info["engine_mmap"] = isinstance(_model_state.engine.leaf_value, np.memmap)
+    info["process_memory"] = _process_memory()
+    info["cache"] = cache_info()
+    info["batcher"] = _batcher.info()
+    info["candidate_index"] = {
+        "available": _model_state is not None and _model_state.candidates is not None,
+        "shortcut_enabled": INDEX_SHORTCUT,
+        "shortcuts": _index_stats["shortcuts"],
+    }
+    return info
+
+def _symptom_columns(user_symptoms, resolver):
+    """Maps free-text symptoms to the set of their column indices; unrecognised terms are skipped."""
+    columns = set()
+    for s in user_symptoms:
+        j = resolver.resolve_term(s)[0]
+        if j is not None:
+            columns.add(j)
+    return columns
+
+def resolve_symptoms(user_symptoms):
+    """Reports how free-text symptoms map onto dataset columns and which diseases they fit.
+
+    Returns {"symptoms": [...column names...], "matched": [{"input", "symptom", "method", "score"}],
+    "unmatched": [...inputs...], "candidates": [{"disease", "evidence"}], "candidates_exact": bool}.
+    candidates is empty when the model has no candidate index.
+    """
+    model = get_model()
+    columns, matched, unmatched = model.resolver.resolve(user_symptoms)
+    candidates, exact = model.candidates.explain(columns) if model.candidates else ([], False)
+    return {
+        "symptoms": [model.symptom_cols[j] for j in sorted(columns)],
+        "matched": matched,
+        "unmatched": unmatched,
+        "candidates": candidates,
+        "candidates_exact": exact,
+    }
+
+def suggest_symptoms(query, limit=DEFAULT_SUGGEST_LIMIT):
+    """Symptoms whose name or a known synonym starts with query, most common in training first."""
+    limit = max(1, min(int(limit), MAX_SUGGEST_LIMIT))
+    return {"query": query, "suggestions": get_model().suggester.suggest(query, limit)}
+
+def next_question(user_symptoms, absent=(), k=DEFAULT_TOP_K):
+    """Suggests which symptom to ask about next, given confirmed and denied symptoms.
+
+    Returns {"question", "alternatives", "done", "entropy", "exact_match", "differential",
+    "matched", "unmatched"}; question is None (and done True) once no answer would
+    narrow the prognoses further.
+    """
+    model = get_model()
+    if model.triage is None:
+        raise RuntimeError("Triage tables missing; retrain or run save_symptom_stats() on Training.csv")
+    present, matched, unmatched = model.resolver.resolve(user_symptoms)
+    denied, denied_matched, denied_unmatched = model.resolver.resolve(absent)
+    # At least one question is ranked, as in _as_differential, so done reflects the gains, not k
+    k = max(1, k)
+    result = model.triage.next_questions(present, denied, k)
+    questions = result["questions"]
+    return {
+        "question": questions[0] if questions else None,
+        "alternatives": questions[1:],
+        "done": not questions,
+        "entropy": result["entropy"],
+        "exact_match": result["exact_match"],
+        "differential": _as_differential(result["posterior"], k),
+        "matched": matched + denied_matched,
+        "unmatched": unmatched + denied_unmatched,
+    }
+
+def _symptom_mask(columns):
+    """Canonical cache key for a symptom set: bit j is set when column j is present."""
+    mask = 0
+    for j in columns:
+        mask |= 1 << j
+    return mask
+
+def _cache_get(key):
+    with _cache_lock:
+        ranked = _result_cache.get(key)
+        if ranked is None:
+            _cache_stats["misses"] += 1
+            return None
+        _result_cache.move_to_end(key)
+        _cache_stats["hits"] += 1
+        return ranked
+
+def _cache_put(key, ranked):
+    with _cache_lock:
+        _result_cache[key] = ranked
+        _result_cache.move_to_end(key)
+        while len(_result_cache) > RESULT_CACHE_SIZE:
+            _result_cache.popitem(last=False)
+            _cache_stats["evictions"] += 1
+
+def _encode_row(columns, n_symptoms):
+    """Encodes symptom columns into this thread's preallocated 1 x n_symptoms uint8 row."""
+    row = getattr(_thread_rows, "row", None)
+    if row is None or row.shape[1] != n_symptoms:
+        row = np.zeros((1, n_symptoms), dtype=np.uint8)
+        _thread_rows.row = row
+    else:
+        row.fill(0)
+    row[0, list(columns)] = 1
+    return row
+
+def _as_differential(ranked, k):
+    return [{"disease": disease, "probability": round(p, 4)} for disease, p in ranked[:max(1, k)]]
+
+def _index_ranking(model, columns):
+    """[(disease, 1.0)] when every training row containing all the symptoms is of that one
+    disease, else None; symptom sets no training row contains always go to the model.
+
+    The differential then has that single disease and no runners-up, which is why the
+    shortcut is off unless YUVA_INDEX_SHORTCUT=1.
+    """
+    if not INDEX_SHORTCUT or model.candidates is None:
+        return None
+    support = model.candidates.row_support(columns)
+    if len(support) != 1:
+        return None
+    _index_stats["shortcuts"] += 1
+    return [(support[0][0], 1.0)]
+
+def _score_uncached(model, pending):
+    """Scores {key: columns} in one engine call, caches the full rankings and returns {key: ranked}."""
+    # One dense uint8 row per distinct uncached symptom set
+    X = np.zeros((len(pending), len(model.symptom_cols)), dtype=np.uint8)
+    for row, columns in enumerate(pending.values()):
+        X[row, list(columns)] = 1
+    scored = dict(zip(pending, model.engine.top_k(X, len(model.engine.classes))))
+    for key, ranked in scored.items():
+        _cache_put(key, ranked)
+    return scored
+
+class MicroBatcher:
+    """Collects concurrent single predictions and scores them together in one engine call.
+
+    A background thread takes whatever requests queued up while the previous batch was
+    being scored. It only waits (up to max_wait_ms, or until max_items) for more when it
+    already sees concurrency, so a lone request at low load is dispatched immediately.
+    """
+
+    def __init__(self, max_items=BATCH_MAX_ITEMS, max_wait_ms=BATCH_MAX_WAIT_MS):
+        self.max_items = max_items
+        self.max_wait = max_wait_ms / 1000.0
+        self._queue = queue.SimpleQueue()
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self._last_batch_size = 0
+        self.stats = {"batches": 0, "items": 0, "max_batch": 0}
+
+    def submit(self, model, key, columns):
+        """Queues one uncached symptom set; the returned Future resolves to its full ranking."""
+        if self._thread is None:
+            with self._start_lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name="predict-batcher", daemon=True)
+                    self._thread.start()
+        future = Future()
+        self._queue.put((model, key, columns, future))
+        return future
+
+    def _collect(self):
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_items:
+            try:
+                batch.append(self._queue.get_nowait())
+                continue
+            except queue.Empty:
+                pass
+            remaining = deadline - time.monotonic()
+            if remaining <= 0 or (len(batch) == 1 and self._last_batch_size <= 1):
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            self._last_batch_size = len(batch)
+            self.stats["batches"] += 1
+            self.stats["items"] += len(batch)
+            self.stats["max_batch"] = max(self.stats["max_batch"], len(batch))
+            # Requests that straddle a model reload carry different models; score each group separately
+            groups = {}
+            for model, key, columns, future in batch:
+                entry = groups.setdefault(id(model), (model, {}, []))
+                entry[1][key] = columns
+                entry[2].append((key, future))
+            for model, pending, waiters in groups.values():
+                try:
+                    scored = _score_uncached(model, pending)
+                except Exception as e:
+                    for _, future in waiters:
+                        future.set_exception(e)
+                    continue
+                for key, future in waiters:
+                    future.set_result(scored[key])
+
+    def info(self):
+        info = dict(self.stats, max_items=self.max_items, max_wait_ms=self.max_wait * 1000)
+        info["mean_batch"] = round(info["items"] / info["batches"], 2) if info["batches"] else None
+        return info
+
+_batcher = MicroBatcher()
+
+def submit_prediction(user_symptoms, k=DEFAULT_TOP_K):
+    """Returns a Future for the top-k differential; cache hits resolve immediately.
+
+    Async callers can await it with asyncio.wrap_future instead of blocking a thread.
+    """
+    model = get_model()
+    columns = _symptom_columns(user_symptoms, model.resolver)
+    key = (model.signature, _symptom_mask(columns))
+    ranked = _cache_get(key)
+    if ranked is None:
+        ranked = _index_ranking(model, columns)
+    if ranked is not None or _batcher.max_items <= 1:
+        if ranked is None:
+            row = _encode_row(columns, len(model.symptom_cols))
+            # Keep the full ranking so any later top_k for the same symptoms is a cache hit
+            ranked = model.engine.top_k(row, len(model.engine.classes))[0]
+            _cache_put(key, ranked)
+        future = Future()
+        future.set_result(_as_differential(ranked, k))
+        return future
+
+    result = Future()
+    scored = _batcher.submit(model, key, columns)
+
+    def _finish(done):
+        if done.exception() is not None:
+            result.set_exception(done.exception())
+        else:
+            result.set_result(_as_differential(done.result(), k))
+    scored.add_done_callback(_finish)
+    return result
+
+def predict_disease_topk(user_symptoms, k=DEFAULT_TOP_K):
+    """Returns the k most probable diseases as [{"disease", "probability"}], best first."""
+    return submit_prediction(user_symptoms, k).result()
 
 def predict_disease(user_symptoms):
     """Predicts the disease based on a list of symptoms."""
-    clf, symptom_cols = load_model()
-    sample = {col: 0 for col in symptom_cols}
-    for s in user_symptoms:
-        s_clean = s.strip()
-        if s_clean in sample:
-            sample[s_clean] = 1
+    return predict_disease_topk(user_symptoms, k=1)[0]["disease"]
+
+def predict_disease_topk_batch(symptom_lists, k=DEFAULT_TOP_K):
+    """Top-k differentials for many symptom lists, scoring all cache misses in one engine call."""
+    if len(symptom_lists) > MAX_BATCH_SIZE:
+        raise ValueError(f"Batch of {len(symptom_lists)} exceeds the limit of {MAX_BATCH_SIZE}")
+    if not symptom_lists:
+        return []
+    model = get_model()
+    column_sets = [_symptom_columns(symptoms, model.resolver) for symptoms in symptom_lists]
+    keys = [(model.signature, _symptom_mask(columns)) for columns in column_sets]
+    return [_as_differential(r, k) for r in _rank_many(model, keys, column_sets)]
+
+def _rank_many(model, keys, column_sets):
+    """Full rankings for many symptom sets: cache hits and index shortcuts first, then one
+    engine call for the distinct remaining sets."""
+    ranked = {}
+    missing = {}
+    for key, columns in zip(keys, column_sets):
+        if key in ranked or key in missing:
+            continue
+        hit = _cache_get(key) or _index_ranking(model, columns)
+        if hit is None:
+            missing[key] = columns
         else:
-            print(f"⚠  '{s_clean}' not in dataset columns—ignored")
-    df = pd.DataFrame([sample])
-    # Ensure all columns are present in the DataFrame
-    for col in symptom_cols:
-        if col not in df.columns:
-            df[col] = 0  # Add missing columns with a default value of 0
-    df = df[symptom_cols]  # Ensure the order of columns is correct
-    return clf.predict(df)[0]
+            ranked[key] = hit
+    if missing:
+        ranked.update(_score_uncached(model, missing))
+    return [ranked[key] for key in keys]
+
+def predict_encoded_topk(X, k=DEFAULT_TOP_K, model=None):
+    """Top-k differentials for rows already encoded as a 0/1 matrix in the model's column order.
+
+    Shares the result cache with predict_disease_topk; identical rows are scored once.
+    """
+    model = model or get_model()
+    X = np.asarray(X)
+    packed = np.packbits(X != 0, axis=1, bitorder="little")
+    keys = [(model.signature, int.from_bytes(row.tobytes(), "little")) for row in packed]
+    column_sets = [np.flatnonzero(row).tolist() for row in X]
+    return [_as_differential(r, k) for r in _rank_many(model, keys, column_sets)]
+
+def predict_disease_batch(symptom_lists):
+    """Predicts diseases for many symptom lists with a single engine call, in input order."""
+    return [ranked[0]["disease"] for ranked in predict_disease_topk_batch(symptom_lists, k=1)]
 
 # Remove or comment out this block to prevent terminal interaction:
 # if __name__ == "__main__":
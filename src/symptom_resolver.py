@@ -0,0 +1,304 @@
+"""
+Free-text symptom resolution.
+
+Maps what users and clinicians type ("Skin Rash", "headahce", "loose motions")
+onto the dataset's symptom columns using, in order: exact column names,
+normalised forms, a small synonym table, and a character trigram index for typos.
+Generic words that could mean several symptoms ("pain", "urine") are left unmatched
+rather than guessed.
+"""
+
+import re
+import unicodedata
+from bisect import bisect_left
+from collections import defaultdict
+
+# Lay terms -> dataset column. Keys are written in normalised form (see normalize()).
+SYNONYMS = {
+    "rash": "skin_rash",
+    "itch": "itching",
+    "itchy": "itching",
+    "fever": "high_fever",
+    "high_temperature": "high_fever",
+    "low_fever": "mild_fever",
+    "low_grade_fever": "mild_fever",
+    "slight_fever": "mild_fever",
+    "sneezing": "continuous_sneezing",
+    "stuffy_nose": "congestion",
+    "blocked_nose": "congestion",
+    "nasal_congestion": "congestion",
+    "tired": "fatigue",
+    "tiredness": "fatigue",
+    "exhaustion": "fatigue",
+    "shortness_of_breath": "breathlessness",
+    "short_of_breath": "breathlessness",
+    "difficulty_breathing": "breathlessness",
+    "stomach_ache": "stomach_pain",
+    "stomachache": "stomach_pain",
+    "tummy_ache": "stomach_pain",
+    "heartburn": "acidity",
+    "vomit": "vomiting",
+    "throwing_up": "vomiting",
+    "diarrhea": "diarrhoea",
+    "loose_motion": "diarrhoea",
+    "loose_motions": "diarrhoea",
+    "jaundice": "yellowish_skin",
+    "yellow_skin": "yellowish_skin",
+    "yellow_eyes": "yellowing_of_eyes",
+    "dizzy": "dizziness",
+    "vertigo": "spinning_movements",
+    "joint_ache": "joint_pain",
+    "body_ache": "muscle_pain",
+    "muscle_ache": "muscle_pain",
+    "palpitation": "palpitations",
+    "racing_heart": "fast_heart_rate",
+    "rapid_heartbeat": "fast_heart_rate",
+    "no_appetite": "loss_of_appetite",
+    "blurred_vision": "blurred_and_distorted_vision",
+    "blurry_vision": "blurred_and_distorted_vision",
+    "painful_urination": "burning_micturition",
+    "burning_urination": "burning_micturition",
+    "frequent_urination": "polyuria",
+    "sore_throat": "throat_irritation",
+    "swollen_glands": "swelled_lymph_nodes",
+    "swollen_lymph_nodes": "swelled_lymph_nodes",
+    "swollen_extremities": "swollen_extremeties",
+    "foul_smelling_urine": "foul_smell_of urine",
+    "toxic_look": "toxic_look_(typhos)",
+    "blood_in_stool": "bloody_stool",
+    "coughing_blood": "blood_in_sputum",
+    "losing_weight": "weight_loss",
+    "anxious": "anxiety",
+    "depressed": "depression",
+    "irritable": "irritability",
+    "scarring": "scurring",
+    "sweat": "sweating",
+    "sweats": "sweating",
+    "sweaty": "sweating",
+}
+
+# Minimum Dice similarity of character trigrams for a typo match
+FUZZY_THRESHOLD = 0.7
+# Shorter terms ("pain", "back") only match exactly or through a synonym
+MIN_FUZZY_KEY = 5
+# A typo match is refused when another symptom scores within this much of the best one
+FUZZY_MARGIN = 0.1
+# Below that, the best few trigram candidates still match within this many edits
+# (transpositions such as "headahce" share few trigrams with "headache")
+MAX_EDITS = 2
+_MEMO_SIZE = 10000
+# Sorts after every character normalize() can produce, so key + _PREFIX_END bounds a prefix range
+_PREFIX_END = "\x7f"
+
+
+def normalize(text):
+    """Lower-cases and joins words with single underscores: ' Skin  Rash' -> 'skin_rash'."""
+    text = unicodedata.normalize("NFKC", text).lower()
+    return re.sub(r"[^a-z0-9]+", "_", text).strip("_")
+
+
+def _trigrams(key):
+    padded = f"_{key}_"
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def _edit_distance(a, b):
+    """Optimal string alignment distance: insertions, deletions, substitutions, transpositions."""
+    prev2, prev = None, list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        cur = [i] + [0] * len(b)
+        for j in range(1, len(b) + 1):
+            cur[j] = min(prev[j] + 1, cur[j - 1] + 1, prev[j - 1] + (a[i - 1] != b[j - 1]))
+            if i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                cur[j] = min(cur[j], prev2[j - 2] + 1)
+        prev2, prev = prev, cur
+    return prev[-1]
+
+
+class SymptomResolver:
+    """Resolves free-text symptom terms to dataset columns; built once per loaded model."""
+
+    def __init__(self, symptom_cols, synonyms=SYNONYMS):
+        self.symptom_cols = list(symptom_cols)
+        self.exact = {col: i for i, col in enumerate(self.symptom_cols)}
+
+        # normalised key -> column index; also keyed without separators ("head ache" -> "headache")
+        self.normalized = {}
+        for i, col in enumerate(self.symptom_cols):
+            key = normalize(col)
+            self.normalized.setdefault(key, i)
+            self.normalized.setdefault(key.replace("_", ""), i)
+        # word -> columns whose name contains it as a whole word, to spot ambiguous terms
+        self._word_columns = defaultdict(set)
+        for i, col in enumerate(self.symptom_cols):
+            for word in normalize(col).split("_"):
+                self._word_columns[word].add(i)
+        self.synonyms = {}
+        for term, col in synonyms.items():
+            if col in self.exact:
+                self.synonyms[normalize(term)] = self.exact[col]
+                self.synonyms.setdefault(normalize(term).replace("_", ""), self.exact[col])
+
+        # Trigram inverted index over every normalised name and synonym
+        names = dict(self.normalized)
+        for key, i in self.synonyms.items():
+            names.setdefault(key, i)
+        self._keys = []
+        self._key_columns = []
+        self._key_sizes = []
+        self._postings = defaultdict(list)
+        for key, i in names.items():
+            grams = _trigrams(key)
+            for gram in grams:
+                self._postings[gram].append(len(self._key_columns))
+            self._keys.append(key)
+            self._key_columns.append(i)
+            self._key_sizes.append(len(grams))
+        self._memo = {}
+
+    def _ambiguous(self, key):
+        """Whether every word of key occurs in more than one column name ("pain", "skin")."""
+        columns = None
+        for word in key.split("_"):
+            found = self._word_columns.get(word, set())
+            columns = found if columns is None else columns & found
+        return len(columns) > 1
+
+    def _fuzzy(self, key):
+        if len(key) < MIN_FUZZY_KEY:
+            return None, 0.0
+        grams = _trigrams(key)
+        overlap = defaultdict(int)
+        for gram in grams:
+            for slot in self._postings.get(gram, ()):
+                overlap[slot] += 1
+        scores = sorted(
+            ((2.0 * shared / (len(grams) + self._key_sizes[slot]), slot) for slot, shared in overlap.items()),
+            reverse=True,
+        )
+        if not scores:
+            return None, 0.0
+        best_score, best_slot = scores[0]
+        column = self._key_columns[best_slot]
+        runner_up = next((score for score, slot in scores if self._key_columns[slot] != column), 0.0)
+        if best_score >= FUZZY_THRESHOLD:
+            if best_score - runner_up < FUZZY_MARGIN:
+                return None, best_score
+            return column, best_score
+        allowed = 1 if len(key) <= 6 else MAX_EDITS
+        edits = sorted((_edit_distance(key, self._keys[slot]), slot) for _, slot in scores[:5])
+        closest = [(n, slot) for n, slot in edits if n == edits[0][0]]
+        if edits[0][0] <= allowed and len({self._key_columns[slot] for _, slot in closest}) == 1:
+            n, slot = edits[0]
+            return self._key_columns[slot], 1.0 - n / max(len(key), len(self._keys[slot]))
+        return None, best_score
+
+    def resolve_term(self, term):
+        """Returns (column index or None, method, score) for one free-text term."""
+        hit = self.exact.get(term)
+        if hit is not None:
+            return hit, "exact", 1.0
+        cached = self._memo.get(term)
+        if cached is not None:
+            return cached
+
+        key = normalize(term)
+        compact = key.replace("_", "")
+        if key in self.normalized or compact in self.normalized:
+            result = (self.normalized.get(key, self.normalized.get(compact)), "normalized", 1.0)
+        elif key in self.synonyms or compact in self.synonyms:
+            result = (self.synonyms.get(key, self.synonyms.get(compact)), "synonym", 1.0)
+        elif key and self._ambiguous(key):
+            result = (None, "ambiguous", 0.0)
+        elif key:
+            column, score = self._fuzzy(key)
+            result = (column, "fuzzy" if column is not None else "unmatched", round(score, 3))
+        else:
+            result = (None, "unmatched", 0.0)
+
+        if len(self._memo) >= _MEMO_SIZE:
+            self._memo.clear()
+        self._memo[term] = result
+        return result
+
+    def resolve(self, terms):
+        """Resolves a list of terms.
+
+        Returns (columns, matched, unmatched): the set of column indices, one
+        {"input", "symptom", "method", "score"} dict per recognised term, and the
+        terms that could not be matched.
+        """
+        columns = set()
+        matched = []
+        unmatched = []
+        for term in terms:
+            column, method, score = self.resolve_term(term)
+            if column is None:
+                unmatched.append(term)
+                continue
+            columns.add(column)
+            matched.append({"input": term, "symptom": self.symptom_cols[column],
+                            "method": method, "score": score})
+        return columns, matched, unmatched
+
+
+def display_name(col):
+    """Human-readable form of a column name: 'toxic_look_(typhos)' -> 'toxic look (typhos)'."""
+    return " ".join(col.replace("_", " ").split())
+
+
+class SymptomSuggester:
+    """Typeahead over symptom names and synonyms, ranked by how often each symptom occurs in training."""
+
+    def __init__(self, symptom_cols, frequency=None, synonyms=SYNONYMS):
+        self.symptom_cols = list(symptom_cols)
+        n = len(self.symptom_cols)
+        self.frequency = [int(c) for c in frequency] if frequency is not None else [0] * n
+        index = {col: i for i, col in enumerate(self.symptom_cols)}
+
+        # Sorted (key, column, tier) index. Every word suffix is a key so "pain" finds
+        # "stomach_pain"; such mid-name matches (tier 1) rank after whole-name ones (tier 0)
+        entries = set()
+        for i, col in enumerate(self.symptom_cols):
+            words = normalize(col).split("_")
+            for start in range(len(words)):
+                entries.add(("_".join(words[start:]), i, min(start, 1)))
+        for term, col in synonyms.items():
+            if col in index:
+                entries.add((normalize(term), index[col], 0))
+        entries = sorted(entries)
+        self._keys = [key for key, _, _ in entries]
+        self._columns = [(i, tier) for _, i, tier in entries]
+
+        self._by_rank = sorted(range(n), key=lambda i: (-self.frequency[i], self.symptom_cols[i]))
+        self._rank = [0] * n
+        for rank, i in enumerate(self._by_rank):
+            self._rank[i] = rank
+        self._memo = {}
+
+    def suggest(self, query, limit=10):
+        """Returns up to limit {"symptom", "label", "count"} dicts whose names start with query."""
+        key = normalize(query or "")
+        cached = self._memo.get((key, limit))
+        if cached is not None:
+            return cached
+
+        if key:
+            lo = bisect_left(self._keys, key)
+            hi = bisect_left(self._keys, key + _PREFIX_END, lo)
+            best_tier = {}
+            for i, tier in self._columns[lo:hi]:
+                best_tier[i] = min(tier, best_tier.get(i, tier))
+            columns = sorted(best_tier, key=lambda i: (best_tier[i], self._rank[i]))
+        else:
+            columns = self._by_rank
+        result = [
+            {"symptom": self.symptom_cols[i], "label": display_name(self.symptom_cols[i]),
+             "count": self.frequency[i]}
+            for i in columns[:max(0, limit)]
+        ]
+
+        if len(self._memo) >= _MEMO_SIZE:
+            self._memo.clear()
+        self._memo[(key, limit)] = result
+        return result
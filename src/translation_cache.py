@@ -0,0 +1,186 @@
+"""
+Two-tier cache of provider translations.
+
+Keyed by the language pair and the normalised source text, so "Take this
+medicine  twice daily" and "take this medicine twice daily" share an entry. An
+in-memory LRU answers repeats without touching disk; behind it a SQLite table
+keeps every translation across restarts and is shared by every server process
+using the same file. Each entry records which provider produced it.
+"""
+
+import os
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+
+_EVICT_EVERY = 100
+# Texts per IN (...) lookup, well under SQLite's bound-parameter limit
+_SQL_BATCH = 500
+
+
+def normalize_text(text):
+    """Cache key form of a text: NFKC, lower-cased, whitespace collapsed."""
+    return " ".join(unicodedata.normalize("NFKC", text).lower().split())
+
+
+class TranslationCache:
+    """LRU of up to memory_size translations in front of an optional SQLite tier.
+
+    Entries older than ttl_s are ignored by both tiers; beyond max_rows the least
+    recently used rows are deleted from disk (checked every _EVICT_EVERY stores). path=None keeps the cache in memory only.
+    """
+
+    def __init__(self, path, ttl_s, memory_size, max_rows):
+        self.path = path
+        self.ttl_s = ttl_s
+        self.memory_size = memory_size
+        self.max_rows = max_rows
+        self._lock = threading.Lock()
+        self._memory = OrderedDict()
+        self.stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "expired": 0, "stores": 0, "evictions": 0}
+        self.provider_hits = {}
+        self._db = None
+        if path:
+            if os.path.dirname(path):
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+            self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS translations ("
+                " src_lang TEXT NOT NULL, tgt_lang TEXT NOT NULL, text TEXT NOT NULL,"
+                " translation TEXT NOT NULL, provider TEXT NOT NULL,"
+                " created_at REAL NOT NULL, last_used REAL NOT NULL,"
+                " PRIMARY KEY (src_lang, tgt_lang, text))"
+            )
+            self._db.execute("CREATE INDEX IF NOT EXISTS translations_last_used ON translations (last_used)")
+
+    @staticmethod
+    def key(text, src_lang, tgt_lang):
+        return src_lang.lower(), tgt_lang.lower(), normalize_text(text)
+
+    def _remember(self, key, entry):
+        self._memory[key] = entry
+        self._memory.move_to_end(key)
+        if len(self._memory) > self.memory_size:
+            self._memory.popitem(last=False)
+
+    def get(self, text, src_lang, tgt_lang):
+        """(translation, provider) for a cached text, or None."""
+        return self.get_many([text], src_lang, tgt_lang)[0]
+
+    def get_many(self, texts, src_lang, tgt_lang):
+        """(translation, provider) or None per text, in order; disk misses of the memory tier
+        are looked up with one query in one transaction."""
+        keys = [self.key(text, src_lang, tgt_lang) for text in texts]
+        now = time.time()
+        found = {}
+        with self._lock:
+            for key in dict.fromkeys(keys):
+                entry = self._memory.get(key)
+                if entry is not None and now - entry[2] <= self.ttl_s:
+                    self._memory.move_to_end(key)
+                    found[key] = entry
+                elif entry is not None:
+                    del self._memory[key]
+                    self.stats["expired"] += 1
+            missing = [key for key in dict.fromkeys(keys) if key not in found]
+            from_disk = {}
+            if missing and self._db is not None:
+                self._db.execute("BEGIN")
+                try:
+                    for i in range(0, len(missing), _SQL_BATCH):
+                        texts_part = [key[2] for key in missing[i:i + _SQL_BATCH]]
+                        rows = self._db.execute(
+                            "SELECT text, translation, provider, created_at FROM translations"
+                            f" WHERE src_lang = ? AND tgt_lang = ? AND text IN ({','.join('?' * len(texts_part))})",
+                            (keys[0][0], keys[0][1], *texts_part)).fetchall()
+                        for text, translation, provider, created_at in rows:
+                            key = (keys[0][0], keys[0][1], text)
+                            if now - created_at > self.ttl_s:
+                                self.stats["expired"] += 1
+                            else:
+                                from_disk[key] = (translation, provider, created_at)
+                    if from_disk:
+                        self._db.executemany(
+                            "UPDATE translations SET last_used = ? WHERE src_lang = ? AND tgt_lang = ? AND text = ?",
+                            [(now, *key) for key in from_disk])
+                    self._db.execute("COMMIT")
+                except BaseException:
+                    self._db.execute("ROLLBACK")
+                    raise
+            for key, entry in from_disk.items():
+                self._remember(key, entry)
+            results = []
+            for key in keys:
+                entry = found.get(key)
+                if entry is not None:
+                    self.stats["memory_hits"] += 1
+                else:
+                    entry = from_disk.get(key)
+                    if entry is None:
+                        self.stats["misses"] += 1
+                        results.append(None)
+                        continue
+                    self.stats["disk_hits"] += 1
+                    # Later repeats of the key in this call are memory hits
+                    found[key] = entry
+                self.provider_hits[entry[1]] = self.provider_hits.get(entry[1], 0) + 1
+                results.append((entry[0], entry[1]))
+        return results
+
+    def put(self, text, src_lang, tgt_lang, translation, provider):
+        """Stores a provider's translation in both tiers."""
+        self.put_many([(text, translation, provider)], src_lang, tgt_lang)
+
+    def put_many(self, items, src_lang, tgt_lang):
+        """Stores (text, translation, provider) items in both tiers, in one disk transaction."""
+        now = time.time()
+        rows = [(*self.key(text, src_lang, tgt_lang), translation, provider, now, now)
+                for text, translation, provider in items]
+        if not rows:
+            return
+        with self._lock:
+            for row in rows:
+                self._remember(row[:3], (row[3], row[4], now))
+            before = self.stats["stores"]
+            self.stats["stores"] += len(rows)
+            if self._db is None:
+                return
+            self._db.execute("BEGIN")
+            try:
+                self._db.executemany("INSERT OR REPLACE INTO translations VALUES (?, ?, ?, ?, ?, ?, ?)", rows)
+                self._db.execute("COMMIT")
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+            # Counting rows is a table scan, so the size cap is enforced every _EVICT_EVERY stores
+            if before // _EVICT_EVERY == self.stats["stores"] // _EVICT_EVERY:
+                return
+            excess = self._db.execute("SELECT COUNT(*) FROM translations").fetchone()[0] - self.max_rows
+            if excess > 0:
+                self._db.execute(
+                    "DELETE FROM translations WHERE rowid IN"
+                    " (SELECT rowid FROM translations ORDER BY last_used LIMIT ?)", (excess,))
+                self.stats["evictions"] += excess
+
+    def info(self):
+        """Hit counters per tier and per provider, hit rate and entry counts."""
+        with self._lock:
+            stats = dict(self.stats)
+            provider_hits = dict(self.provider_hits)
+            memory_entries = len(self._memory)
+            disk_entries = (self._db.execute("SELECT COUNT(*) FROM translations").fetchone()[0]
+                            if self._db is not None else None)
+        hits = stats["memory_hits"] + stats["disk_hits"]
+        lookups = hits + stats["misses"]
+        return {
+            "path": self.path,
+            "ttl_s": self.ttl_s,
+            "memory_entries": memory_entries,
+            "disk_entries": disk_entries,
+            **stats,
+            "hits_by_provider": provider_hits,
+            "hit_rate": round(hits / lookups, 4) if lookups else None,
+        }
@@ -0,0 +1,326 @@
+"""
+Translation plumbing shared by api.py and simple_api.py.
+
+Provider translations are cached per language pair and normalised text (see
+translation_cache), so phrases staff repeat all day are translated upstream once.
+
+On a miss, translate_remote() asks the providers in order of preference through one
+shared async client. If the first has not answered within TRANSLATION_HEDGE_DELAY_S
+(or fails sooner) the next is asked too; the first good answer wins and the other
+call is cancelled. A provider that keeps failing is skipped by its circuit breaker
+until it has had time to recover.
+
+Every request carries a Deadline: each provider call gets only the budget that is
+left, and once it runs out the dispatcher gives up, so a caller's wait is bounded
+by the budget it asked for rather than by the sum of provider timeouts.
+
+translate_many_remote() does the same for a batch: LibreTranslate is sent many texts
+per call, and only what it leaves untranslated is sent to the other providers one by one.
+"""
+
+import asyncio
+import os
+import sqlite3
+import threading
+
+import httpx
+
+from translation_cache import TranslationCache, normalize_text
+from upstream import CircuitBreaker, Deadline
+
+# An empty path keeps the cache in memory only
+TRANSLATION_CACHE_PATH = os.environ.get(
+    "YUVA_TRANSLATION_CACHE_PATH",
+    os.path.join(os.path.dirname(__file__), ".translation_cache", "translations.sqlite3"))
+TRANSLATION_CACHE_TTL_S = float(os.environ.get("YUVA_TRANSLATION_CACHE_TTL_S", str(30 * 24 * 3600)))
+TRANSLATION_CACHE_SIZE = int(os.environ.get("YUVA_TRANSLATION_CACHE_SIZE", "4096"))
+TRANSLATION_CACHE_MAX_ROWS = int(os.environ.get("YUVA_TRANSLATION_CACHE_MAX_ROWS", "200000"))
+
+# Provider endpoints; point them at local stand-ins for testing
+LIBRETRANSLATE_URL = os.environ.get("YUVA_LIBRETRANSLATE_URL", "https://libretranslate.de/translate")
+GOOGLE_TRANSLATE_URL = os.environ.get("YUVA_GOOGLE_TRANSLATE_URL", "https://translate.googleapis.com/translate_a/single")
+USER_AGENT = "YUVA-Medical-Platform/1.0"
+TRANSLATION_CONNECT_TIMEOUT_S = float(os.environ.get("YUVA_TRANSLATION_CONNECT_TIMEOUT_S", "3"))
+TRANSLATION_TIMEOUT_S = float(os.environ.get("YUVA_TRANSLATION_TIMEOUT_S", "10"))
+# How long the preferred provider has before the next one is asked as well
+TRANSLATION_HEDGE_DELAY_S = float(os.environ.get("YUVA_TRANSLATION_HEDGE_DELAY_S", "1"))
+# Consecutive failures that open a provider's breaker, and how long it then stays open
+BREAKER_FAILURES = int(os.environ.get("YUVA_TRANSLATION_BREAKER_FAILURES", "3"))
+BREAKER_RESET_S = float(os.environ.get("YUVA_TRANSLATION_BREAKER_RESET_S", "30"))
+# Time budget of a translation request when the caller does not send one, and the most it may ask for
+DEFAULT_TRANSLATION_BUDGET_MS = float(os.environ.get("YUVA_TRANSLATION_BUDGET_MS", "8000"))
+MAX_TRANSLATION_BUDGET_MS = 30000
+# Request header carrying the caller's remaining budget in milliseconds
+DEADLINE_HEADER = "X-Deadline-Ms"
+MAX_TRANSLATION_BATCH = 200
+# Texts per LibreTranslate call (it accepts a list as q) and batch calls in flight at once
+LIBRETRANSLATE_BATCH_SIZE = int(os.environ.get("YUVA_LIBRETRANSLATE_BATCH_SIZE", "25"))
+TRANSLATION_BATCH_CONCURRENCY = int(os.environ.get("YUVA_TRANSLATION_BATCH_CONCURRENCY", "4"))
+
+_cache = None
+_cache_lock = threading.Lock()
+_client = None
+
+
+class ProviderError(Exception):
+    """A provider answered without a usable translation."""
+
+
+def request_deadline(deadline_ms=None):
+    """Deadline for a request from the budget it sent (body field or header), clamped to MAX_TRANSLATION_BUDGET_MS."""
+    try:
+        budget_ms = float(deadline_ms) if deadline_ms not in (None, "") else DEFAULT_TRANSLATION_BUDGET_MS
+    except (TypeError, ValueError):
+        budget_ms = DEFAULT_TRANSLATION_BUDGET_MS
+    return Deadline(max(0.0, min(budget_ms, MAX_TRANSLATION_BUDGET_MS)) / 1000.0)
+
+
+def provider_timeout(deadline):
+    """Per-call timeout: the provider's usual limits, cut to what is left of the deadline."""
+    remaining = deadline.remaining() if deadline is not None else TRANSLATION_TIMEOUT_S
+    return httpx.Timeout(min(TRANSLATION_TIMEOUT_S, remaining),
+                         connect=min(TRANSLATION_CONNECT_TIMEOUT_S, remaining))
+
+
+def budget_report(deadline):
+    """The budget and how much of it was used, in ms, for the response."""
+    return {"budget_ms": round(deadline.budget_s * 1000, 1), "elapsed_ms": round(deadline.elapsed() * 1000, 1)}
+
+
+def get_translation_cache():
+    """The shared translation cache, opened on first use; memory-only if the SQLite file cannot be opened."""
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                try:
+                    _cache = TranslationCache(TRANSLATION_CACHE_PATH or None, TRANSLATION_CACHE_TTL_S,
+                                              TRANSLATION_CACHE_SIZE, TRANSLATION_CACHE_MAX_ROWS)
+                except (OSError, sqlite3.Error) as e:
+                    print(f"⚠ Translation cache file unavailable ({e}); caching in memory only")
+                    _cache = TranslationCache(None, TRANSLATION_CACHE_TTL_S,
+                                              TRANSLATION_CACHE_SIZE, TRANSLATION_CACHE_MAX_ROWS)
+    return _cache
+
+
+def get_client():
+    """The shared provider client, created on first use inside the running event loop."""
+    global _client
+    if _client is None or _client.is_closed:
+        _client = httpx.AsyncClient(
+            timeout=httpx.Timeout(TRANSLATION_TIMEOUT_S, connect=TRANSLATION_CONNECT_TIMEOUT_S),
+            headers={"User-Agent": USER_AGENT},
+        )
+    return _client
+
+
+async def close_translation_client():
+    """Closes the shared provider client; call on application shutdown."""
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+
+async def translate_with_libretranslate(text, src_lang, tgt_lang, deadline=None):
+    payload = {"q": text, "source": src_lang, "target": tgt_lang, "format": "text"}
+    response = await get_client().post(LIBRETRANSLATE_URL, json=payload, timeout=provider_timeout(deadline))
+    response.raise_for_status()
+    translation = response.json().get("translatedText", "")
+    if not translation:
+        raise ProviderError("empty translatedText")
+    return translation
+
+
+async def translate_with_google(text, src_lang, tgt_lang, deadline=None):
+    params = {"client": "gtx", "sl": src_lang, "tl": tgt_lang, "dt": "t", "q": text}
+    response = await get_client().get(GOOGLE_TRANSLATE_URL, params=params, timeout=provider_timeout(deadline))
+    response.raise_for_status()
+    data = response.json()
+    # One [translated, original, ...] segment per sentence
+    translation = "".join(segment[0] for segment in (data[0] or ()) if segment and segment[0]) if data else ""
+    if not translation:
+        raise ProviderError("no translated segments")
+    return translation
+
+
+async def translate_many_with_libretranslate(texts, src_lang, tgt_lang, deadline=None):
+    """Translates a list of texts in one LibreTranslate call; "" for any text it left untranslated."""
+    payload = {"q": list(texts), "source": src_lang, "target": tgt_lang, "format": "text"}
+    response = await get_client().post(LIBRETRANSLATE_URL, json=payload, timeout=provider_timeout(deadline))
+    response.raise_for_status()
+    translations = response.json().get("translatedText")
+    if not isinstance(translations, list) or len(translations) != len(texts):
+        raise ProviderError("translatedText is not a list matching q")
+    return [t if isinstance(t, str) else "" for t in translations]
+
+
+# (name, coroutine function), most preferred first
+PROVIDERS = [
+    ("libretranslate", translate_with_libretranslate),
+    ("google", translate_with_google),
+]
+_breakers = {name: CircuitBreaker(BREAKER_FAILURES, BREAKER_RESET_S) for name, _ in PROVIDERS}
+_provider_stats = {name: {"calls": 0, "wins": 0, "failures": 0, "slow": 0, "cancelled": 0} for name, _ in PROVIDERS}
+_dispatch_stats = {"requests": 0, "batches": 0, "hedged": 0, "all_failed": 0, "no_provider": 0, "deadline_exceeded": 0}
+
+
+async def translate_remote(text, src_lang, tgt_lang, deadline=None, hedge_delay_s=None, providers=None):
+    """First good provider translation as (translation, provider), or (None, None) if every provider
+    fails or the deadline runs out first.
+
+    Providers whose breaker is open are skipped. The next provider is started when the
+    running ones have all failed or hedge_delay_s has passed without an answer; the
+    calls still running when one succeeds are cancelled. providers restricts the chain
+    to a subset of PROVIDERS.
+    """
+    hedge_delay_s = TRANSLATION_HEDGE_DELAY_S if hedge_delay_s is None else hedge_delay_s
+    deadline = deadline or request_deadline()
+    _dispatch_stats["requests"] += 1
+    if deadline.expired:
+        _dispatch_stats["deadline_exceeded"] += 1
+        return None, None
+    loop = asyncio.get_running_loop()
+    waiting = list(PROVIDERS if providers is None else providers)
+    running = {}
+    started = {}
+    won = False
+
+    def start_next():
+        while waiting:
+            name, provider = waiting.pop(0)
+            if _breakers[name].allow():
+                _provider_stats[name]["calls"] += 1
+                task = asyncio.ensure_future(provider(text, src_lang, tgt_lang, deadline))
+                running[task] = name
+                started[task] = loop.time()
+                return True
+        return False
+
+    if not start_next():
+        _dispatch_stats["no_provider"] += 1
+        return None, None
+    try:
+        while running:
+            timeout = min(hedge_delay_s, deadline.remaining()) if waiting else deadline.remaining()
+            done, _ = await asyncio.wait(running, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+            if not done and deadline.expired:
+                _dispatch_stats["deadline_exceeded"] += 1
+                return None, None
+            if not done:
+                if start_next():
+                    _dispatch_stats["hedged"] += 1
+                continue
+            for task in done:
+                name = running.pop(task)
+                try:
+                    translation = task.result()
+                except Exception as e:
+                    print(f"{name} error: {e!r}")
+                    # Running out of the caller's budget is not the provider's fault
+                    if isinstance(e, httpx.TimeoutException) and deadline.expired:
+                        _breakers[name].record_cancelled()
+                    else:
+                        _breakers[name].record_failure()
+                        _provider_stats[name]["failures"] += 1
+                    continue
+                _breakers[name].record_success()
+                _provider_stats[name]["wins"] += 1
+                won = True
+                return translation, name
+            if not running and not deadline.expired:
+                start_next()
+        _dispatch_stats["all_failed"] += 1
+        return None, None
+    finally:
+        # Losers of the race, or everything if the caller itself was cancelled. A loser that
+        # had already run past the hedge delay counts as a failure, so a provider that is
+        # consistently too slow is skipped too instead of costing every request the delay.
+        now = loop.time()
+        for task, name in running.items():
+            if not task.done():
+                task.cancel()
+            elif not task.cancelled():
+                task.exception()  # finished as the deadline hit; retrieve it so it is not reported as lost
+            if won and now - started[task] >= hedge_delay_s:
+                _provider_stats[name]["slow"] += 1
+                _breakers[name].record_failure()
+            else:
+                _provider_stats[name]["cancelled"] += 1
+                _breakers[name].record_cancelled()
+
+
+async def _translate_chunk(chunk, src_lang, tgt_lang, deadline, semaphore):
+    """(translation, provider) per text of a chunk: one LibreTranslate call, then the
+    other providers text by text for whatever that left untranslated."""
+    results = [(None, None)] * len(chunk)
+    breaker = _breakers["libretranslate"]
+    async with semaphore:
+        if not deadline.expired and breaker.allow():
+            _provider_stats["libretranslate"]["calls"] += 1
+            try:
+                translations = await translate_many_with_libretranslate(chunk, src_lang, tgt_lang, deadline)
+            except asyncio.CancelledError:
+                breaker.record_cancelled()
+                raise
+            except Exception as e:
+                print(f"libretranslate batch error: {e!r}")
+                if isinstance(e, httpx.TimeoutException) and deadline.expired:
+                    breaker.record_cancelled()
+                else:
+                    breaker.record_failure()
+                    _provider_stats["libretranslate"]["failures"] += 1
+            else:
+                breaker.record_success()
+                _provider_stats["libretranslate"]["wins"] += 1
+                results = [(t, "libretranslate") if t else (None, None) for t in translations]
+
+    fallback = [(name, provider) for name, provider in PROVIDERS if name != "libretranslate"]
+
+    async def one(text):
+        async with semaphore:
+            return await translate_remote(text, src_lang, tgt_lang, deadline, providers=fallback)
+
+    missing = [i for i, (translation, _) in enumerate(results) if translation is None]
+    if missing and fallback and not deadline.expired:
+        for i, result in zip(missing, await asyncio.gather(*(one(chunk[i]) for i in missing))):
+            results[i] = result
+    return results
+
+
+async def translate_many_remote(texts, src_lang, tgt_lang, deadline=None):
+    """Provider translations of many texts as (translation, provider) pairs in input order;
+    (None, None) for the ones no provider translated within the deadline.
+
+    Texts that normalise the same (as cache keys do) are translated once. Texts go to LibreTranslate LIBRETRANSLATE_BATCH_SIZE
+    per call, at most TRANSLATION_BATCH_CONCURRENCY calls at a time; what a batch call does
+    not translate goes to the remaining providers one text at a time, under the same bound.
+    """
+    deadline = deadline or request_deadline()
+    _dispatch_stats["batches"] += 1
+    first = {}
+    for text in texts:
+        first.setdefault(normalize_text(text), text)
+    unique = list(first.values())
+    semaphore = asyncio.Semaphore(TRANSLATION_BATCH_CONCURRENCY)
+    size = max(1, LIBRETRANSLATE_BATCH_SIZE)
+    chunks = [unique[i:i + size] for i in range(0, len(unique), size)]
+    results = {}
+    for chunk, chunk_results in zip(chunks, await asyncio.gather(
+            *(_translate_chunk(chunk, src_lang, tgt_lang, deadline, semaphore) for chunk in chunks))):
+        results.update(zip(map(normalize_text, chunk), chunk_results))
+    return [results[normalize_text(text)] for text in texts]
+
+
+def translation_info():
+    """Translation cache metrics and per-provider breaker state and counters."""
+    return {
+        "cache": get_translation_cache().info(),
+        "hedge_delay_s": TRANSLATION_HEDGE_DELAY_S,
+        "default_budget_ms": DEFAULT_TRANSLATION_BUDGET_MS,
+        **_dispatch_stats,
+        "providers": {
+            name: {"state": _breakers[name].state, "trips": _breakers[name].trips, **_provider_stats[name]}
+            for name, _ in PROVIDERS
+        },
+    }
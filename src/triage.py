@@ -0,0 +1,122 @@
+"""
+Interactive triage: which symptom to ask about next.
+
+Works from the distinct (symptom row, prognosis) pairs of the training data and
+how often each occurs, saved at train time in symptom_stats.npz. Given the
+answers so far, it keeps the training rows that agree with them and picks the
+unasked symptom whose answer is expected to remove the most entropy from the
+distribution over prognoses. No forest is scored; rows are kept grouped by
+prognosis so one question costs a per-class sum over the surviving rows.
+"""
+
+import numpy as np
+
+from symptom_resolver import display_name
+
+_MEMO_SIZE = 10000
+
+
+def _entropy(counts, axis=0):
+    """Shannon entropy in bits of integer count vectors along axis; zero for all-zero vectors.
+
+    Uses H = log2(N) - sum(c * log2(c)) / N, which needs no division per cell and,
+    since counts are whole numbers, no special case for zeros (log2(max(c, 1)) is 0 there).
+    """
+    total = counts.sum(axis=axis)
+    safe_total = np.maximum(total, 1)
+    c_log_c = (counts * np.log2(np.maximum(counts, 1))).sum(axis=axis)
+    return np.where(total > 0, np.log2(safe_total) - c_log_c / safe_total, 0.0)
+
+
+class TriageTable:
+    """Distinct training rows with their prognosis and count, for information-gain questioning."""
+
+    def __init__(self, rows, labels, counts, classes, symptom_cols):
+        order = np.argsort(labels, kind="stable")
+        self.rows = np.asarray(rows, dtype=np.float64)[order]      # (n_distinct, n_symptoms) 0/1, grouped by label
+        self.labels = np.asarray(labels, dtype=np.intp)[order]     # (n_distinct,) index into classes, ascending
+        self.counts = np.asarray(counts, dtype=np.float64)[order]  # (n_distinct,) occurrences in training
+        self.classes = np.asarray(classes).astype(str)
+        self.symptom_cols = list(symptom_cols)
+        self._memo = {}
+
+    @classmethod
+    def from_stats(cls, stats, symptom_cols):
+        """Builds the table from a loaded symptom_stats.npz, or returns None for files written before triage."""
+        if "rows" not in stats:
+            return None
+        return cls(stats["rows"], stats["labels"], stats["counts"], stats["classes"], symptom_cols)
+
+    def _weights(self, present, absent):
+        """Counts of the rows that agree with the answers, and whether any row agrees with all of them.
+
+        Rows showing a denied symptom are dropped. Of the rest, only those sharing the most
+        confirmed symptoms are kept, so an unseen combination still narrows the field.
+        """
+        weights = self.counts.copy()
+        if absent:
+            weights[self.rows[:, absent].any(axis=1)] = 0.0
+            if not weights.any():
+                weights = self.counts.copy()
+        if not present:
+            return weights, True
+        overlap = self.rows[:, present].sum(axis=1)
+        best = overlap[weights > 0].max()
+        weights[overlap < best] = 0.0
+        return weights, bool(best == len(present))
+
+    def next_questions(self, present, absent=(), k=3):
+        """Ranks unasked symptoms by expected information gain over the prognoses.
+
+        present and absent are column indices. Returns a dict with the current entropy,
+        whether the answers match a training row exactly, up to k questions as
+        {"symptom", "label", "information_gain", "p_yes"} (best first, only those that
+        gain anything) and the remaining prognoses as (label, probability) pairs.
+        """
+        present, absent = sorted(set(present)), sorted(set(absent) - set(present))
+        memo_key = (tuple(present), tuple(absent), k)
+        cached = self._memo.get(memo_key)
+        if cached is not None:
+            return cached
+        weights, exact = self._weights(present, absent)
+
+        # Only the surviving rows take part; after a couple of answers that is a handful.
+        # Rows are sorted by label, so each remaining class is one contiguous run.
+        keep = np.flatnonzero(weights)
+        labels = self.labels[keep]
+        starts = np.flatnonzero(np.r_[True, labels[1:] != labels[:-1]])
+        classes = labels[starts]
+        class_total = np.add.reduceat(weights[keep], starts)
+        total = class_total.sum()
+        entropy = float(_entropy(class_total))
+
+        # (remaining classes, n_symptoms): weighted count of rows per class showing each symptom
+        yes = np.add.reduceat(self.rows[keep] * weights[keep, None], starts)
+        no = class_total[:, None] - yes
+        n_yes = yes.sum(axis=0)
+        expected = (n_yes * _entropy(yes) + (total - n_yes) * _entropy(no)) / total
+        gain = entropy - expected
+        gain[present + absent] = -np.inf
+
+        questions = []
+        for j in np.argsort(-gain, kind="stable")[:max(0, k)]:
+            if gain[j] <= 1e-9:
+                break
+            questions.append({
+                "symptom": self.symptom_cols[j],
+                "label": display_name(self.symptom_cols[j]),
+                "information_gain": round(float(gain[j]), 4),
+                "p_yes": round(float(n_yes[j] / total), 4),
+            })
+
+        order = np.argsort(-class_total, kind="stable")
+        result = {
+            "entropy": round(entropy, 4),
+            "exact_match": exact,
+            "questions": questions,
+            "posterior": [(str(self.classes[classes[i]]), float(class_total[i] / total)) for i in order],
+        }
+        if len(self._memo) >= _MEMO_SIZE:
+            self._memo.clear()
+        self._memo[memo_key] = result
+        return result
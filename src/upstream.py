@@ -0,0 +1,151 @@
+"""
+Helpers for polite calls to third-party services from the async endpoints.
+
+SingleFlight runs one call per key at a time and hands its result to every caller
+that asks for the same key meanwhile. TokenBucket spaces calls to a sustained rate
+with a small burst and refuses callers who would have to wait too long, so they
+can be answered from a cache or a fallback instead of piling up. CircuitBreaker
+stops sending calls to a service that keeps failing until it has had time to recover.
+Deadline carries one request's time budget across every upstream step it takes.
+"""
+
+import asyncio
+import time
+
+
+class RateLimited(Exception):
+    """The call was refused because the rate limiter's queue is full; retry_after_s is the wait it was refused."""
+
+    def __init__(self, message, retry_after_s=None):
+        super().__init__(message)
+        self.retry_after_s = retry_after_s
+
+
+class SingleFlight:
+    """Coalesces concurrent async calls that share a key into one."""
+
+    def __init__(self):
+        self._flights = {}
+        self.coalesced = 0
+
+    async def do(self, key, call):
+        """Awaits call() for key, or joins the call already in flight for it.
+
+        The call runs as its own task, so a caller that is cancelled does not cancel it
+        for the others; everyone gets its result or its exception.
+        """
+        task = self._flights.get(key)
+        if task is None:
+            task = asyncio.ensure_future(call())
+            self._flights[key] = task
+            task.add_done_callback(lambda _: self._flights.pop(key, None))
+        else:
+            self.coalesced += 1
+        return await asyncio.shield(task)
+
+    def __len__(self):
+        return len(self._flights)
+
+
+class TokenBucket:
+    """Async rate limiter: rate calls per second on average, bursts of up to burst.
+
+    Callers are queued in arrival order by reserving the next free slot (the generic
+    cell rate algorithm); one whose slot is more than max_wait_s away is refused with
+    RateLimited without taking a slot.
+    """
+
+    def __init__(self, rate, burst=1, max_wait_s=0.0):
+        self.interval = 1.0 / rate
+        self.burst = burst
+        self.max_wait_s = max_wait_s
+        self._tat = 0.0  # theoretical arrival time of the next call at the sustained rate
+        self.waited = 0
+        self.rejected = 0
+
+    def reserve(self):
+        """Reserves the next slot and returns how long to wait for it; raises RateLimited."""
+        now = time.monotonic()
+        tat = max(self._tat, now)
+        wait = tat - (self.burst - 1) * self.interval - now
+        if wait > self.max_wait_s:
+            self.rejected += 1
+            raise RateLimited(f"next upstream slot in {wait:.1f}s", wait)
+        self._tat = tat + self.interval
+        return max(wait, 0.0)
+
+    async def acquire(self):
+        wait = self.reserve()
+        if wait > 0:
+            self.waited += 1
+            await asyncio.sleep(wait)
+
+
+class CircuitBreaker:
+    """Stops calling a provider after repeated failures, then probes it again after a cool-off.
+
+    Closed: calls go through. After failure_threshold consecutive failures it opens and
+    allow() is False for reset_timeout_s; then it is half-open and lets a single probe
+    call through, whose success closes it again and whose failure re-opens it.
+    """
+
+    def __init__(self, failure_threshold=3, reset_timeout_s=30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout_s = reset_timeout_s
+        self.failures = 0
+        self.opened_at = None
+        self._probing = False
+        self.trips = 0
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_timeout_s:
+            return "half-open"
+        return "open"
+
+    def allow(self):
+        """Whether a call may go out now; in the half-open state this claims the one probe."""
+        state = self.state
+        if state == "closed":
+            return True
+        if state == "half-open" and not self._probing:
+            self._probing = True
+            return True
+        return False
+
+    def record_success(self):
+        self.failures = 0
+        self.opened_at = None
+        self._probing = False
+
+    def record_failure(self):
+        self.failures += 1
+        if self._probing or self.failures >= self.failure_threshold:
+            if self.opened_at is None or self._probing:
+                self.trips += 1
+            self.opened_at = time.monotonic()
+        self._probing = False
+
+    def record_cancelled(self):
+        """A call given up on without an outcome (e.g. it lost a hedged race); frees the probe."""
+        self._probing = False
+
+
+class Deadline:
+    """A time budget started now, shared by every step of a fallback chain."""
+
+    def __init__(self, budget_s):
+        self.budget_s = budget_s
+        self._start = time.monotonic()
+
+    def elapsed(self):
+        return time.monotonic() - self._start
+
+    def remaining(self):
+        return max(self.budget_s - self.elapsed(), 0.0)
+
+    @property
+    def expired(self):
+        return self.remaining() <= 0.0
@@ -22,6 +22,10 @@ class VoiceMedicalTranslator:
         self.engine = pyttsx3.init()
         self.last_translated = ""
         self.backend_url = "http://localhost:5000"
+        # Budget the backend gets for its whole fallback chain; the HTTP timeout allows a little more
+        # so the backend's own answer (translated or not) arrives before this client gives up
+        self.backend_budget_ms = 4000
+        self.backend_timeout_s = 5
         
         # Configure TTS
         self.engine.setProperty('rate', 150)  # Speed of speech
@@ -50,12 +54,16 @@ class VoiceMedicalTranslator:
                 json={
                     "text": text,
                     "src_lang": src_lang,
-                    "tgt_lang": tgt_lang
+                    "tgt_lang": tgt_lang,
+                    "deadline_ms": self.backend_budget_ms
                 },
-                timeout=5
+                timeout=self.backend_timeout_s
             )
             if response.status_code == 200:
                 data = response.json()
+                if data.get("tier") == "none":
+                    # The backend ran out of providers or budget; let the local fallback try
+                    return ""
                 return data.get("translation", "")
         except Exception as e:
             print(f"Backend translation failed: {e}")
@@ -84,6 +92,41 @@ class VoiceMedicalTranslator:
         
         return translation or f"Translation not available for: {text}"
 
+    def translate_batch_with_backend(self, texts, src_lang, tgt_lang):
+        """Translate many texts in one request to the backend; None if it cannot take the batch"""
+        try:
+            response = requests.post(
+                f"{self.backend_url}/translate/batch",
+                json={
+                    "texts": texts,
+                    "src_lang": src_lang,
+                    "tgt_lang": tgt_lang,
+                    "deadline_ms": self.backend_budget_ms
+                },
+                timeout=self.backend_timeout_s
+            )
+            if response.status_code == 200:
+                return [r.get("translation", "") if r.get("tier") != "none" else ""
+                        for r in response.json().get("results", [])]
+        except Exception as e:
+            print(f"Backend batch translation failed: {e}")
+        return None
+
+    def translate_batch(self, texts, src_lang, tgt_lang):
+        """Translate a list of texts, keeping their order"""
+        if src_lang == tgt_lang:
+            return list(texts)
+
+        translations = self.translate_batch_with_backend(list(texts), src_lang, tgt_lang)
+        if translations is None or len(translations) != len(texts):
+            # Backend without the batch endpoint (or over its batch limit): one text at a time
+            return [self.translate_text(text, src_lang, tgt_lang) for text in texts]
+
+        # Fallback to Google Translate for whatever the backend could not translate
+        return [translation or self.translate_with_google(text, src_lang, tgt_lang)
+                or f"Translation not available for: {text}"
+                for text, translation in zip(texts, translations)]
+
     def record_and_translate(self, src_lang='en', tgt_lang='es'):
         """Record speech and translate it"""
         print(f"\n🎤 Listening for {src_lang} speech...")